@@ -1,15 +1,8 @@
 # _*_ coding: UTF-8 _*_
 
 import os
-import re
 import sys
-import zipfile
-from io import BytesIO
-from PIL import Image as PImage
-import openpyxl as xl
-from openpyxl.drawing import image
-import win32com.client as win32
-import pdfplumber
+import multiprocessing
 import logging
 
 from gui.ui_docx2pdf import Docx2PdfWindow
@@ -28,12 +21,30 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QLabel,
     QTextEdit,
+    QSpinBox,
+    QComboBox,
 )
 from PySide6.QtGui import QIcon
 from PySide6.QtCore import Qt, QThread, Signal, QSize, QStandardPaths
 
 # 日志配置
 from logger import setup_logging, get_error_logger, safe_execute, log_checkpoint
+from core.fileutil import default_workers
+from core.manifest import Manifest
+from core.pdfcache import PdfCache, cacheName
+from core.templatecache import template_cache, templateCacheDir
+from core.templatemeta import read_template_meta
+from core.imagecache import clear_images, imageCacheDir
+from core.archive import zip_folder, compressionMethods
+from core.watch import DirectoryWatcher
+from core.excelworker import excel_worker
+from core.report import (
+    ReportCancelled,
+    uut_name,
+    default_template,
+    build_report,
+    embed_zip,
+)
 
 logName = "EMIRper.log"
 setup_logging(log_dir=".", log_filename=logName)
@@ -43,121 +54,179 @@ logger = logging.getLogger(__name__)
 error_logger = get_error_logger()
 
 
-class ProcessPdfThread(QThread):
-    progress_updated = Signal(int)  # 发送进度更新信号
-    processing_finished = Signal(dict)  # 发送处理完成信号
-    processing_error = Signal(str)  # 发送错误信息信号
-
-    def __init__(self, directory):
+class ReportThread(QThread):
+    progress_updated = Signal(int)  # 发送已解析的文件数量
+    status_changed = Signal(str)  # 发送当前阶段
+    report_finished = Signal(str, dict)  # 发送报告路径和写入位置
+    report_error = Signal(str)  # 发送错误信息信号
+    report_cancelled = Signal()  # 已响应取消
+
+    def __init__(
+        self,
+        directory,
+        template,
+        loadqty,
+        header,
+        img_path,
+        workers=1,
+        cache_path=None,
+        template_cache=None,
+        image_cache=None,
+        manifest=None,
+        known=None,
+    ):
         super().__init__()
         self.directory = directory
+        self.template = template
+        self.loadqty = loadqty
+        self.header = header
+        self.img_path = img_path
+        self.workers = workers  # 解析进程数，1为单进程顺序解析
+        self.cache_path = cache_path  # 解析缓存文件，None则不使用缓存
+        self.template_cache = template_cache
+        self.image_cache = image_cache
+        self.manifest = manifest  # 目录清单，解析与压缩共用读入的文件内容
+        self.known = known  # 监视模式已解析的结果，这些文件不再解析
+        self.problems = []  # 文件名的问题以及pdf内容与文件名不符的项
 
     def run(self):
+        # 解析、写入模板和保存都在本线程中进行，界面线程只处理最后的对话框
         try:
-            result = self.dealDirs(self.directory)
-            self.processing_finished.emit(result)
+            SaveFile, writer = build_report(
+                self.directory,
+                self.template,
+                self.loadqty,
+                self.workers,
+                self.header,
+                self.img_path,
+                self.cache_path,
+                self.onProgress,
+                template_cache=self.template_cache,
+                should_stop=self.isInterruptionRequested,
+                problems=self.problems,
+                image_cache=self.image_cache,
+                manifest=self.manifest,
+                known=self.known,
+            )
+        except ReportCancelled:
+            logger.info("Report cancelled.")
+            self.report_cancelled.emit()
+            return
         except Exception as e:
-            self.processing_error.emit(str(e))
+            self.report_error.emit(str(e))
             return
-        logger.info(f"Pdf Processing completed!")
-
-    def openPdf(self, path_pdf):
-        # 读取pdf文件，提取数据
-        with pdfplumber.open(path_pdf) as pdf:
-            text = pdf.pages[0].extract_text() + "\n" + pdf.pages[1].extract_text()
-            datas = [item for item in text.split("\n") if item]
-            return self.dealDatas(datas)
-
-    def dealDatas(self, datas):
-        res = {}
-        for data in datas[:20]:
-            tmp = data.split(" ")
-            if tmp[0] == "Serial":
-                res["Serial"] = tmp[-1]
-            elif tmp[0] == "Power":
-                res["Power"] = tmp[-1]
-            elif tmp[0] == "Load":
-                res["Load"] = tmp[-1]
-        resdatas = []
-        for it in datas[15:]:
-            data = it.split(" ")
-            if len(data) > 10:
-                resdatas.append(data)
-        for i in range(len(resdatas)):
-            resdatas[i][0] = str(i + 1)
-        res["datas"] = resdatas
-        res_avg = sorted(res["datas"], key=lambda x: float(x[7]), reverse=False)
-        # 对pk列升序排列
-        res_pk = sorted(res["datas"], key=lambda x: float(x[4]), reverse=False)
-        # 取avg和pk中最小的
-        res["datas"] = (
-            res_avg if float(res_avg[0][7]) <= float(res_pk[0][4]) else res_pk
+        logger.info("Report assembly completed!")
+        self.report_finished.emit(
+            SaveFile,
+            {
+                "row_sn_": writer.row_sn_,
+                "row_end_": writer.row_end_,
+                "col_end_": writer.col_end_,
+            },
         )
-        return res
 
-    def dealDirs(self, modeldir):
-        res = {}
-        source_files = [f for f in os.listdir(modeldir) if f.endswith(".pdf")]
+    def onProgress(self, done, total):
+        self.progress_updated.emit(done)
+        if done == total:
+            self.status_changed.emit("正在保存报告...")
 
-        for i, source_file in enumerate(source_files):
-            logger.info(f"Deal pdf fileName: {source_file}")
-            try:
-                res[source_file] = self.openPdf(os.path.join(modeldir, source_file))
-                # 发送进度更新信号
-                self.progress_updated.emit(i + 1)
-            except Exception as e:
-                logger.error(f"Error pdf processing {source_file}: {e}")
-                continue
-        return res
+
+class WatchThread(QThread):
+    file_parsed = Signal(str, int)  # 发送新解析的文件名和已解析数量
+
+    def __init__(self, directory, workers=1, cache_path=None, interval=2.0):
+        super().__init__()
+        self.directory = directory
+        self.workers = workers
+        self.interval = interval
+        # 解析结果保存在内存中，生成报告时通过 watcher.snapshot() 取得
+        self.watcher = DirectoryWatcher(directory, cache_path, workers)
+
+    def run(self):
+        watcher = self.watcher
+
+        def on_parsed(name, data, err):
+            if err is None:
+                self.file_parsed.emit(name, len(watcher.results))
+
+        watcher.run(self.interval, self.isInterruptionRequested, on_parsed)
 
 
 class ZipThread(QThread):
     progress_updated = Signal(int)  # 发送进度更新信号
-    zip_finished = Signal(str)  # 压缩完成信号
+    zip_finished = Signal(str)  # 压缩完成信号，发送压缩包路径
     zip_error = Signal(str)  # 压缩错误信号
-
-    def __init__(self, directory, zipname):
+    zip_cancelled = Signal()  # 已响应取消
+
+    def __init__(
+        self,
+        directory,
+        zipname,
+        workers=1,
+        method="auto",
+        manifest=None,
+        incremental=True,
+    ):
         super().__init__()
-        self.directory = directory
+        self.directory = directory  # 绝对路径，不依赖工作目录
         self.zipname = zipname
+        self.workers = workers  # 压缩进程数
+        self.method = method  # 压缩方式，见 compressionMethods
+        self.manifest = manifest  # 与报告线程共用的目录清单
+        self.incremental = incremental  # 只压缩新增和改动的pdf
 
     def run(self):
         self.zip_folder()
 
     def zip_folder(self):
         try:
-            file_count = 0
-            pdf_files = []
-
-            # 先统计需要压缩的PDF文件
-            for rootPath, _, files in os.walk(self.directory):
-                for file in files:
-                    if file.endswith(".pdf"):
-                        file_count += 1
-                        pdf_files.append((rootPath, file))
-
-            # 执行压缩操作
-            logger.info(f"Zipping {file_count} files...")
-            with zipfile.ZipFile(
-                f"{self.zipname}.zip", "w", zipfile.ZIP_LZMA
-            ) as harZip:
-                for i, (rootPath, file) in enumerate(pdf_files):
-                    if not file.endswith(".pdf"):
-                        continue
-                    file_path = os.path.join(rootPath, file)
-                    arcname = os.path.relpath(file_path, self.directory)
-                    harZip.write(file_path, arcname=arcname)
-
-                    # 发送进度更新信号
-                    self.progress_updated.emit(i + 1)
-
+            zippath = zip_folder(
+                self.directory,
+                self.zipname,
+                self.onProgress,
+                self.workers,
+                method=self.method,
+                manifest=self.manifest,
+                incremental=self.incremental,
+            )
             # 压缩完成，发送完成信号
-            self.zip_finished.emit(self.zipname)
+            self.zip_finished.emit(zippath)
+        except ReportCancelled:
+            logger.info("Zip cancelled.")
+            self.zip_cancelled.emit()
         except Exception as e:
             self.zip_error.emit(str(e))
 
+    def onProgress(self, done):
+        self.progress_updated.emit(done)
+        # 在下一个文件处停止，未完成的临时文件由 zip_folder 删除
+        if self.isInterruptionRequested():
+            raise ReportCancelled("Zip cancelled.")
+
+
+class EmbedThread(QThread):
+    embed_finished = Signal(str, str)  # 嵌入完成，发送报告路径和错误信息
+
+    def __init__(self, SaveFile, zippath, row_sn, col_end):
+        super().__init__()
+        self.SaveFile = SaveFile
+        self.zippath = zippath
+        self.row_sn = row_sn
+        self.col_end = col_end
+
+    def run(self):
+        # 重写整个xlsx并压缩嵌入的压缩包，不能放在界面线程中
+        try:
+            embed_zip(self.SaveFile, self.zippath, self.row_sn, self.col_end)
+        except Exception as e:
+            self.embed_finished.emit(self.SaveFile, str(e))
+            return
+        self.embed_finished.emit(self.SaveFile, "")
+
 
 class EMIWindow(MainWindow):
+    embed_finished = Signal(str, str)  # Excel线程嵌入完成，发送报告路径和错误信息
+
     def __init__(self, parent=None):
         super().__init__()
 
@@ -180,13 +249,24 @@ class EMIWindow(MainWindow):
             "NeedZip": True,  # 是否需要压缩
             "AddZip": True,  # 是否嵌入压缩包到excel文件
             "CloseExcel": False,  # 是否在处理完毕后关闭excel程序
+            "Workers": default_workers(),  # pdf解析和压缩的进程数
+            "UseCache": True,  # 是否使用pdf解析缓存
+            "Compression": "auto",  # 压缩方式
+            "IncrementalZip": True,  # 是否只压缩新增和改动的pdf
+            "EmbedEngine": "openxml",  # 嵌入压缩包的方式: openxml 直接写文件，excel 通过Excel
         }
         self.settings = {}  # 设置
         self.windows: list[QWidget] = []  # 打开的窗口
         self.log_path = os.path.join(os.getcwd(), logName)  # 日志文件路径
+        self.cache_path = os.path.join(os.getcwd(), cacheName)  # 解析缓存路径
+        self.template_cache_dir = templateCacheDir  # 模板快照只放在用户自己的目录中
+        self.image_cache_dir = os.path.join(os.getcwd(), imageCacheDir)
         self.save_file_name = None
 
-        self.res = None
+        self.report_thread = None  # 正在生成报告的线程
+        self.zip_thread = None  # 与报告线程同时运行的压缩线程
+        self.zip_path = None  # 本次压缩完成的压缩包
+        self.embed_thread = None  # 不经过Excel嵌入压缩包的线程
 
     def init_connect(self):
         self.btn_exit.clicked.connect(self.close)
@@ -202,6 +282,8 @@ class EMIWindow(MainWindow):
         self.action_log.triggered.connect(self.show_log)
         self.action_topdf.triggered.connect(self.show_docx2pdf)
         self.action_wordreplace.triggered.connect(self.show_wordreplace)
+        self.action_watch.toggled.connect(self.toggle_watch)
+        self.embed_finished.connect(self.onEmbedFinished)
 
     def select_modelpath(self):
         log_checkpoint("Before opening directory dialog", "select_modelpath")
@@ -292,11 +374,55 @@ class EMIWindow(MainWindow):
         # 关闭所有窗口
         for window in self.windows:
             window.close()
+        self.stop_watch()
+        if self.report_thread is not None:
+            self.report_thread.requestInterruption()
+            self.report_thread.wait()
         return super().closeEvent(event)
 
+    def toggle_watch(self, checked):
+        # 测试过程中边导出边解析，结果保存在内存中，生成报告时直接使用；
+        # 启用缓存时同时写入解析缓存
+        if not checked:
+            self.stop_watch()
+            return
+        directory = self.lineEdit_model.text()
+        if not os.path.isdir(directory):
+            QMessageBox.warning(self, "Warning", f"No such directory: {directory}")
+            self.action_watch.setChecked(False)
+            return
+        use_cache = self.settings_value["UseCache"]
+        self.watch_thread = WatchThread(
+            directory,
+            self.settings_value["Workers"],
+            self.cache_path if use_cache else None,
+        )
+        self.watch_thread.file_parsed.connect(self.onWatchParsed)
+        self.watch_thread.start()
+        where = "内存和解析缓存" if use_cache else "内存（未启用缓存）"
+        self.statusBar().showMessage(f"正在监视 {directory}，解析结果保存在{where}")
+        logger.info(f"Watch started: {directory}")
+
+    def stop_watch(self):
+        if getattr(self, "watch_thread", None) is None:
+            return
+        self.watch_thread.requestInterruption()
+        self.watch_thread.wait()
+        self.watch_thread = None
+        self.statusBar().showMessage("已停止监视")
+        logger.info("Watch stopped")
+
+    def onWatchParsed(self, name, count):
+        self.statusBar().showMessage(f"正在监视...已解析{count}个文件，最新: {name}")
+
     def update_Setting(self):
-        for key, _ in self.settings.items():
-            self.settings_value[key] = self.settings[key].isChecked()
+        for key, widget in self.settings.items():
+            if isinstance(widget, QSpinBox):
+                self.settings_value[key] = widget.value()
+            elif isinstance(widget, QComboBox):
+                self.settings_value[key] = widget.currentText()
+            else:
+                self.settings_value[key] = widget.isChecked()
         logger.info(f"Setting updated: {self.settings_value}")
 
     def update_log(self):
@@ -321,6 +447,13 @@ class EMIWindow(MainWindow):
         self.Text_log.clear()
         logger.info("Log cleared.")
 
+    def clear_cache(self):
+        cache = PdfCache(self.cache_path)
+        cache.clear()
+        cache.close()
+        template_cache(self.template_cache_dir).clear()
+        clear_images(self.image_cache_dir)
+
     def show_docx2pdf(self):
         if hasattr(self, "docx2pdf_win") and self.docx2pdf_win is not None:
             self.docx2pdf_win.show()
@@ -383,7 +516,9 @@ class EMIWindow(MainWindow):
         label_closeExcel = QLabel(
             text="执行完毕关闭Excel程序:", alignment=Qt.AlignRight | Qt.AlignVCenter
         )
-        label_closeExcel.setToolTip("是否在处理完毕后关闭excel程序，默认保留。")
+        label_closeExcel.setToolTip(
+            "是否在处理完毕后关闭后台的excel程序，默认保留给下一份报告复用。"
+        )
         layoutH_3.addWidget(label_closeExcel)
         self.closeExcel_checkbox = QCheckBox()
         self.closeExcel_checkbox.setChecked(self.settings_value["CloseExcel"])
@@ -391,6 +526,78 @@ class EMIWindow(MainWindow):
         layout.addLayout(layoutH_3)
         self.settings["CloseExcel"] = self.closeExcel_checkbox
 
+        layoutH_4 = QHBoxLayout()
+        label_workers = QLabel(
+            text="并行进程数:", alignment=Qt.AlignRight | Qt.AlignVCenter
+        )
+        label_workers.setToolTip("并行解析和压缩pdf的进程数，设为1则逐个处理。")
+        layoutH_4.addWidget(label_workers)
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(1, os.cpu_count() or 1)
+        self.workers_spinbox.setValue(self.settings_value["Workers"])
+        layoutH_4.addWidget(self.workers_spinbox)
+        layout.addLayout(layoutH_4)
+        self.settings["Workers"] = self.workers_spinbox
+
+        layoutH_5 = QHBoxLayout()
+        label_useCache = QLabel(
+            text="使用解析缓存:", alignment=Qt.AlignRight | Qt.AlignVCenter
+        )
+        label_useCache.setToolTip("未改动的pdf直接读取上次的解析结果。")
+        layoutH_5.addWidget(label_useCache)
+        self.useCache_checkbox = QCheckBox()
+        self.useCache_checkbox.setChecked(self.settings_value["UseCache"])
+        layoutH_5.addWidget(self.useCache_checkbox)
+        button_clearCache = QPushButton(text="清除缓存")
+        button_clearCache.clicked.connect(self.clear_cache)
+        layoutH_5.addWidget(button_clearCache)
+        layout.addLayout(layoutH_5)
+        self.settings["UseCache"] = self.useCache_checkbox
+
+        layoutH_6 = QHBoxLayout()
+        label_compression = QLabel(
+            text="压缩方式:", alignment=Qt.AlignRight | Qt.AlignVCenter
+        )
+        label_compression.setToolTip(
+            "auto: 抽样后自动选择；stored: 不压缩；deflate: 较快；lzma: 最小但最慢。"
+        )
+        layoutH_6.addWidget(label_compression)
+        self.compression_combo = QComboBox()
+        self.compression_combo.addItems(["auto"] + list(compressionMethods))
+        self.compression_combo.setCurrentText(self.settings_value["Compression"])
+        layoutH_6.addWidget(self.compression_combo)
+        layout.addLayout(layoutH_6)
+        self.settings["Compression"] = self.compression_combo
+
+        layoutH_7 = QHBoxLayout()
+        label_incremental = QLabel(
+            text="增量压缩:", alignment=Qt.AlignRight | Qt.AlignVCenter
+        )
+        label_incremental.setToolTip(
+            "只压缩新增和改动的pdf，其余文件沿用上次压缩包中的数据。"
+        )
+        layoutH_7.addWidget(label_incremental)
+        self.incremental_checkbox = QCheckBox()
+        self.incremental_checkbox.setChecked(self.settings_value["IncrementalZip"])
+        layoutH_7.addWidget(self.incremental_checkbox)
+        layout.addLayout(layoutH_7)
+        self.settings["IncrementalZip"] = self.incremental_checkbox
+
+        layoutH_8 = QHBoxLayout()
+        label_embed = QLabel(
+            text="嵌入方式:", alignment=Qt.AlignRight | Qt.AlignVCenter
+        )
+        label_embed.setToolTip(
+            "openxml: 直接写入xlsx文件，不需要打开Excel；excel: 通过Excel插入对象。"
+        )
+        layoutH_8.addWidget(label_embed)
+        self.embed_combo = QComboBox()
+        self.embed_combo.addItems(["openxml", "excel"])
+        self.embed_combo.setCurrentText(self.settings_value["EmbedEngine"])
+        layoutH_8.addWidget(self.embed_combo)
+        layout.addLayout(layoutH_8)
+        self.settings["EmbedEngine"] = self.embed_combo
+
         layoutBTN = QHBoxLayout()
         button_Save = QPushButton(text="保存")
         button_Save.clicked.connect(self.update_Setting)
@@ -533,202 +740,73 @@ class EMIWindow(MainWindow):
         self.done_win.show()
         self.windows.append(self.done_win)
 
-    def open_template(self):
+    def template_path(self):
         tmpFile = self.lineEdit_template.text()
         loadqty = self.spin_qty.value()
         # 检查是否存在模板文件，默认3个负载
         if not tmpFile or tmpFile == "":
-            tmpFile = f"2.1 Conducted EMI Measurement_{loadqty}.xlsx"
-            if loadqty not in [3, 4]:
-                logger.warning(f"Unexpected load quantity: {loadqty}, defaulting to 3.")
-                tmpFile = "2.1 Conducted EMI Measurement_3.xlsx"
-            tmpFile = "template/" + tmpFile
+            tmpFile = default_template(loadqty)
 
         if not os.path.exists(tmpFile):
             tmpFile = self.select_templatepath()
         else:
             self.lineEdit_template.setText(os.path.abspath(tmpFile))
-
-        try:
-            wb = xl.load_workbook(tmpFile)
-        except FileNotFoundError:
+        if not tmpFile or not os.path.exists(tmpFile):
             logger.warning(f"No template file found: {tmpFile}")
             QMessageBox.warning(self, "Warning", f"No template file found: {tmpFile}")
+            return None
+        return tmpFile
+
+    def get_testdetail(self):
+        tmpFile = self.template_path()
+        if tmpFile is None:
             return
+        try:
+            # 只读取测试说明，不加载工作簿
+            RpDetail, _ = read_template_meta(tmpFile)
         except Exception as e:
             logger.error(f"Error opening template file: {e}")
             QMessageBox.warning(self, "Error", f"Error opening template file: {e}")
             return
-        return wb
-
-    def get_testdetail(self):
-        wb = self.open_template()
-        if wb is None:
-            return
-        ws = wb["Conducted EMI"]
-        RpDetail = ws.cell(8, 6).value
         self.text_detail.setText(RpDetail)
-        wb.close()
-
-    def main_func(self, res):
-        directory = self.lineEdit_model.text()
-        loadqty = self.spin_qty.value()
-        tmpFile = self.lineEdit_template.text()
-
-        wb = self.open_template()
-        if wb is None:
-            return
-        ws_setup = wb["Setup"]
-
-        self.row_sn_ = ws_setup.cell(row=1, column=2).value
-        self.col_sn_ = ws_setup.cell(row=2, column=2).value
-        self.col_vol_ = ws_setup.cell(row=3, column=2).value
-        self.col_line_ = ws_setup.cell(row=4, column=2).value
-        self.col_load_ = ws_setup.cell(row=5, column=2).value
-        self.row_end_ = ws_setup.cell(row=7, column=2).value
-        self.col_end_ = ws_setup.cell(row=8, column=2).value
 
-        ws = wb["Conducted EMI"]
-
-        if not os.path.exists(directory):
-            logger.warning(f"No such directory: {directory}")
-            QMessageBox.warning(self, "Warning", f"No such directory: {directory}")
-            return
-
-        directory = os.path.realpath(directory)
-        root_dir = os.path.dirname(directory)
-        directory = os.path.basename(directory)
-
-        os.chdir(root_dir)  # 改变工作目录
-
-        # 写入单体型号
-        tmpp = directory.split("-")
-        if len(tmpp) > 1:
-            ws["F5"] = uutname = tmpp[0] + "-" + tmpp[1]
-        else:
-            ws["F5"] = uutname = directory
-        # 测试日期
-        ws["F6"] = self.date_test.date().toString("yyyy/MM/dd")
-        # 工令
-        ws["F44"] = self.lineEdit_workerno.text()
-        # 版本
-        ws["H44"] = self.lineEdit_rev.text()
-        # D/C
-        ws["I44"] = self.lineEdit_week.text()
-        # 测试detail
-        ws["F8"] = self.text_detail.toPlainText()
-        # 放置图片
-        img_path = self.lineEdit_img.text()
-        if os.path.exists(img_path):
-            img_path = os.path.realpath(img_path)
-            with PImage.open(img_path) as pimg:
-                if pimg.mode in ("RGBA", "P"):
-                    pimg = pimg.convert("RGB")
-                ratio = 250 / pimg.height
-                new_size = (int(pimg.width * ratio), int(pimg.height * ratio))
-                pimg = pimg.resize(new_size, PImage.Resampling.LANCZOS)
-
-                buffer = BytesIO()
-                pimg.save(buffer, format="JPEG", quality=100, optimize=True)
-                buffer.seek(0)
-
-            img = image.Image(buffer)
-            ws.add_image(img, "C27")
-
-        test_count = len(set([it.split("-")[0] for it in res.keys()]))
-
-        if test_count > 5:
-            logger.warning(f"Number of Load is too many! {test_count}")
+    def main_func(self, SaveFile, rows):
+        # 报告已在线程中保存，这里只记录写入位置并处理对话框
+        self.row_sn_ = rows["row_sn_"]
+        self.row_end_ = rows["row_end_"]
+        self.col_end_ = rows["col_end_"]
+        self.save_file_name = SaveFile
+        problems = self.report_thread.problems
+        if problems:
             QMessageBox.warning(
-                self, "Warning", f"Number of Load is too many! {test_count}"
-            )
-            return
-
-        # 处理合并单元格
-        merged_cells = list(ws.merged_cells)
-        for cell in merged_cells:
-            if cell.min_row == self.row_sn_ + loadqty * 4 * test_count:
-                ws.unmerge_cells(cell.coord)
-
-        # 删去多余的行
-        ws.delete_rows(
-            self.row_sn_ + loadqty * 4 * test_count,
-            loadqty * 4 * (5 - test_count),
-        )
-        self.row_end_ = ws.max_row - 4
-        logger.info(f"Max row after deletion: {self.row_end_}")
-
-        # 写入数据
-        line_dict = {"L1": "Line", "N": "Neutral"}
-        for item_key, datas in res.items():
-            row_sn = self.row_sn_
-            while (
-                ws.cell(row=row_sn, column=self.col_sn_).value is not None
-                and ws.cell(row=row_sn, column=self.col_sn_).value != datas["Serial"]
-            ):
-                row_sn += loadqty * 4
-            if ws.cell(row=row_sn, column=self.col_sn_).value is None:
-                ws.cell(row=row_sn, column=self.col_sn_).value = datas["Serial"]
-
-            row_vol = row_sn + (
-                loadqty * 2
-                if ws.cell(row=row_sn, column=self.col_vol_).value
-                != int(re.match(r"\d+", datas["Power"]).group())
-                else 0
-            )
-            row_load = row_vol
-            try:
-                while row_load < row_vol + (loadqty * 2) and int(
-                    ws.cell(row=row_load, column=self.col_load_).value * 100
-                ) != int(re.match(r"\d+", datas["Load"]).group()):
-                    row_load += 2
-            except Exception as e:
-                msg = self.tr("负载数量与模板不符！")
-                logger.error(msg)
-                QMessageBox.information(self, "错误", msg)
-                return
-
-            data = datas["datas"][0]
-            row_line = (
-                row_load + 1
-                if ws.cell(row=row_load, column=self.col_line_).value
-                != line_dict.get(data[9], "Unknown")
-                else row_load
+                self,
+                "Warning",
+                "文件名有问题或与pdf内容不符（已按pdf内容写入）:\n"
+                + "\n".join(problems),
             )
-            # 写入数据
-            ws.cell(row=row_line, column=self.col_load_ + 1).value = data[0]
-            ws.cell(row=row_line, column=self.col_load_ + 2).value = data[1]
-            ws.cell(row=row_line, column=self.col_load_ + 3).value = data[3]
-            ws.cell(row=row_line, column=self.col_load_ + 4).value = data[6]
-            ws.cell(row=row_line, column=self.col_load_ + 5).value = "-"
-            ws.cell(row=row_line, column=self.col_load_ + 6).value = data[2]
-            ws.cell(row=row_line, column=self.col_load_ + 7).value = data[5]
-
-        # 保存文件
-        SaveFile = re.sub(r"_\d\.xlsx", f"_{uutname}.xlsx", os.path.basename(tmpFile))
-        wb.remove(ws_setup)
-        wb.save(SaveFile)
-        self.save_file_name = SaveFile
-        logger.info("Writted into report.")
-        if self.settings_value["NeedZip"]:
-            try:
-                self.zip_folder(directory, uutname)
-            except Exception as e:
-                logger.error(f"Error during zipping or embedding: {e}")
-                QMessageBox.critical(
-                    self, "Error", f"Error during zipping or embedding: {e}"
-                )
 
     def getpdfdatas(self):
         if self.getpdf_running:
-            logger.warning("Getting PDF is already running, do not start again")
+            # 运行中再次点击按钮为取消
+            self.cancel_report()
             return
         self.getpdf_running = True
         logger.info("Getting PDF start")
 
         directory = self.lineEdit_model.text()
-        source_files = [f for f in os.listdir(directory) if f.endswith(".pdf")]
+        if not os.path.exists(directory):
+            logger.warning(f"No such directory: {directory}")
+            QMessageBox.warning(self, "Warning", f"No such directory: {directory}")
+            self.getpdf_running = False
+            return
+        # 目录只扫描一次，报告线程和压缩线程共用清单和读入的文件内容
+        manifest = Manifest(directory)
+        source_files = manifest.pdfs
         self.file_count = len(source_files)
+        tmpFile = self.template_path()
+        if tmpFile is None:
+            self.getpdf_running = False
+            return
 
         # 创建状态栏进度条
         self.statusBar().showMessage("正在处理文件...")
@@ -739,88 +817,166 @@ class EMIWindow(MainWindow):
         self.progressBar.setValue(0)
         self.statusBar().addPermanentWidget(self.progressBar)
 
-        # 启动处理线程
-        self.process_thread = ProcessPdfThread(directory)
-        self.process_thread.progress_updated.connect(self.updateProgressBar)
-        self.process_thread.processing_finished.connect(self.onProcessingFinished)
-        self.process_thread.processing_error.connect(self.onProcessingError)
-        self.process_thread.start()
+        # 启动报告线程，解析的同时加载模板并逐个写入结果
+        header = {
+            "date": self.date_test.date().toString("yyyy/MM/dd"),
+            "workerno": self.lineEdit_workerno.text(),
+            "rev": self.lineEdit_rev.text(),
+            "week": self.lineEdit_week.text(),
+            "detail": self.text_detail.toPlainText(),
+        }
+        use_cache = self.settings_value["UseCache"]
+        self.manifest = manifest
+        self.save_file_name = None
+        self.zip_path = None
+        if self.settings_value["NeedZip"]:
+            # 解析的同时在后台读入所有文件，压缩时不再读取磁盘
+            manifest.prefetch()
+        known = None
+        watch_thread = getattr(self, "watch_thread", None)
+        if watch_thread is not None and os.path.realpath(
+            watch_thread.directory
+        ) == os.path.realpath(directory):
+            # 监视中已解析且之后没有改动的文件直接使用
+            known = watch_thread.watcher.snapshot()
+            logger.info(f"Using {len(known)} results from watch mode")
+        self.report_thread = ReportThread(
+            directory,
+            tmpFile,
+            self.spin_qty.value(),
+            header,
+            self.lineEdit_img.text(),
+            workers=self.settings_value["Workers"],
+            cache_path=self.cache_path if use_cache else None,
+            template_cache=self.template_cache_dir if use_cache else None,
+            image_cache=self.image_cache_dir if use_cache else None,
+            manifest=manifest,
+            known=known,
+        )
+        self.report_thread.progress_updated.connect(self.updateProgressBar)
+        self.report_thread.status_changed.connect(self.statusBar().showMessage)
+        self.report_thread.report_finished.connect(self.onReportFinished)
+        self.report_thread.report_error.connect(self.onReportError)
+        self.report_thread.report_cancelled.connect(self.onReportCancelled)
+        self.report_thread.start()
+        if self.settings_value["NeedZip"]:
+            # 压缩与解析同时进行，压缩包与报告在同一目录
+            real_dir = os.path.realpath(directory)
+            try:
+                self.zip_folder(
+                    real_dir,
+                    os.path.join(os.path.dirname(real_dir), uut_name(real_dir)),
+                    manifest,
+                )
+            except Exception as e:
+                logger.error(f"Error during zipping: {e}")
+                QMessageBox.critical(self, "Error", f"Error during zipping: {e}")
+        self.btn_start.setText(self.tr("取消"))
 
-    def onProcessingFinished(self, result):
-        self.res = result
+    def cancel_report(self):
+        if self.report_thread is None and self.zip_thread is None:
+            return
+        reply = QMessageBox.question(
+            self,
+            self.tr("取消"),
+            self.tr("是否取消生成报告？"),
+            QMessageBox.StandardButton.Yes,
+            QMessageBox.StandardButton.No,
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            logger.info("Cancelling report...")
+            self.statusBar().showMessage("正在取消...")
+            self.stop_tasks()
+
+    def stop_tasks(self):
+        # 报告和压缩是同一次任务，取消或失败时一起停止
+        for thread in (self.report_thread, self.zip_thread):
+            if thread is not None:
+                thread.requestInterruption()
+
+    def endReport(self):
         self.statusBar().removeWidget(self.progressBar)
-        # 继续后续处理
-        self.main_func(self.res)
-        self.getpdf_running = False
+        self.report_thread = None
 
-    def onProcessingError(self, error_msg):
-        logger.error(f"Pdf Processing error: {error_msg}")
-        QMessageBox.critical(self, "Error", f"Pdf Processing error: {error_msg}")
-        self.statusBar().removeWidget(self.progressBar)
+    def tasks_done(self):
+        # 报告和压缩都结束后才释放读入内存的文件内容并嵌入压缩包
+        if self.report_thread is not None or self.zip_thread is not None:
+            return
+        self.manifest.close()
+        self.btn_start.setText(self.tr("开始"))
+        self.getpdf_running = False
+        SaveFile = self.save_file_name
+        if SaveFile is None:
+            return
+        if self.zip_path and self.settings_value["AddZip"]:
+            self.addZipToExcel(self.zip_path, SaveFile)
+        else:
+            self.show_done(SaveFile)
 
-    def updateProgressBar(self):
-        value = self.progressBar.value() + 1
+    def onReportFinished(self, SaveFile, rows):
+        # 继续后续处理
+        self.main_func(SaveFile, rows)
+        self.endReport()
+        if self.zip_thread is not None:
+            self.statusBar().showMessage("报告已保存，正在等待压缩完成...")
+        self.tasks_done()
+
+    def onReportError(self, error_msg):
+        logger.error(f"Report error: {error_msg}")
+        self.stop_tasks()
+        QMessageBox.critical(self, "Error", f"Report error: {error_msg}")
+        self.endReport()
+        self.tasks_done()
+
+    def onReportCancelled(self):
+        self.stop_tasks()
+        self.endReport()
+        self.statusBar().showMessage("已取消")
+        self.tasks_done()
+
+    def updateProgressBar(self, value):
         self.progressBar.setValue(value)
         self.statusBar().showMessage(f"正在处理文件...{value}/{self.file_count}")
 
-    def addZipToExcel(self, zipname, SaveFile):
-        excel = self.open_Excel()
-        if excel is None:
-            return
-        try:
-            wb = excel.Workbooks.Open(os.path.abspath(SaveFile))
-            ws = wb.Worksheets("Conducted EMI")
-            if ws.ProtectContents:
-                ws.Unprotect()
-            ws.Cells(self.row_sn_, self.col_end_ - 2).Select()
-            ws.OLEObjects().Add(
-                ClassType=None,
-                Filename=os.path.abspath(f"{zipname}.zip"),
-                Link=False,
-                DisplayAsIcon=True,
+    def addZipToExcel(self, zippath, SaveFile):
+        if self.settings_value["EmbedEngine"] == "excel":
+            # 在常驻的Excel线程中嵌入，完成后通过信号回到界面线程
+            self.statusBar().showMessage("正在通过Excel嵌入压缩包...")
+            future = excel_worker().submit(
+                "embed_zip",
+                SaveFile,
+                zippath,
+                self.row_sn_,
+                self.col_end_,
+                recycle=self.settings_value["CloseExcel"],
             )
-            # xlEdgeButtom = 9; xlMedium = -4138; xlContinuous = 1
-            ws.Range(
-                ws.Cells(self.row_end_, 2), ws.Cells(self.row_end_, self.col_end_ - 1)
-            ).Select()
-            ws.Range(
-                ws.Cells(self.row_end_, 2), ws.Cells(self.row_end_, self.col_end_ - 1)
-            ).Borders(9).LineStyle = 1
-            ws.Range(
-                ws.Cells(self.row_end_, 2), ws.Cells(self.row_end_, self.col_end_ - 1)
-            ).Borders(9).Weight = -4138
-            wb.Save()
-            if self.settings_value["CloseExcel"]:
-                excel.Quit()
-        except Exception as e:
-            logger.error(f"Error adding zip to Excel: {e}")
-            QMessageBox.critical(self, "Error", f"Error adding zip to Excel: {e}")
-
-    def open_Excel(self):
-        while True:
-            try:
-                excel = win32.Dispatch("Excel.Application")
-                excel.Visible = True
-                return excel
-            except:
-                logger.error("Please install Microsoft Excel 2010 or later.")
-                reply = QMessageBox.information(
-                    self,
-                    self.tr("Excel打开失败"),
-                    self.tr("请安装 Microsoft Excel 2010或更新的版本。是否重试？"),
-                    QMessageBox.StandardButton.Yes,
-                    QMessageBox.StandardButton.No,
+            future.add_done_callback(
+                lambda f: self.embed_finished.emit(
+                    SaveFile, "" if f.exception() is None else str(f.exception())
                 )
-                if reply == QMessageBox.StandardButton.No:
-                    return None
+            )
+            return
+        self.statusBar().showMessage("正在嵌入压缩包...")
+        self.embed_thread = EmbedThread(SaveFile, zippath, self.row_sn_, self.col_end_)
+        self.embed_thread.embed_finished.connect(self.onEmbedFinished)
+        self.embed_thread.start()
+
+    def onEmbedFinished(self, SaveFile, error_msg):
+        # Excel线程和嵌入线程都通过信号回到界面线程，这里只处理对话框
+        if error_msg:
+            logger.error(f"Error adding zip to Excel: {error_msg}")
+            QMessageBox.critical(
+                self, "Error", f"Error adding zip to Excel: {error_msg}"
+            )
+        else:
+            self.statusBar().showMessage("嵌入完成！")
+        self.show_done(SaveFile)
 
-    def zip_folder(self, directory, zipname):
+    def zip_folder(self, directory, zipname, manifest=None):
         logger.info("Zipping folder...")
-        file_count = 0
-        for rootPath, _, files in os.walk(directory):
-            for _file in files:
-                if _file.endswith(".pdf"):
-                    file_count += 1
+        if manifest is None:
+            manifest = Manifest(directory)
+        file_count = len(manifest)
         self.zip_progressBar = QProgressBar(self.statusBar_main)
         self.zip_progressBar.setMaximumHeight(15)
         self.zip_progressBar.setMaximum(file_count)
@@ -830,10 +986,18 @@ class EMIWindow(MainWindow):
         self.statusBar().showMessage("正在压缩文件...")
         self.statusBar().addPermanentWidget(self.zip_progressBar)
 
-        self.zip_thread = ZipThread(directory, zipname)
+        self.zip_thread = ZipThread(
+            directory,
+            zipname,
+            self.settings_value["Workers"],
+            self.settings_value["Compression"],
+            manifest,
+            self.settings_value["IncrementalZip"],
+        )
         self.zip_thread.progress_updated.connect(self.updateZipProgressBar)
         self.zip_thread.zip_finished.connect(self.onZipFinished)
         self.zip_thread.zip_error.connect(self.onZipError)
+        self.zip_thread.zip_cancelled.connect(self.onZipCancelled)
         self.zip_thread.start()
 
     def updateZipProgressBar(self, value):
@@ -844,31 +1008,35 @@ class EMIWindow(MainWindow):
             f"正在压缩文件...{value}/{self.zip_progressBar.maximum()}"
         )
 
-    def onZipFinished(self, zipname):
-        # 压缩完成处理
+    def endZip(self):
         if hasattr(self, "zip_progressBar"):
             self.statusBar().removeWidget(self.zip_progressBar)
             del self.zip_progressBar
-            self.statusBar().showMessage("压缩完成！")
-
-        # 如果需要嵌入Excel，则继续执行
-        SaveFile = getattr(self, "save_file_name", None)  # 获取保存的文件名
-        if SaveFile and self.settings_value["AddZip"]:
-            self.addZipToExcel(zipname, SaveFile)
+        self.zip_thread = None
 
+    def onZipFinished(self, zippath):
+        # 压缩完成处理，报告也已保存时嵌入压缩包并显示完成窗口
+        self.endZip()
+        self.statusBar().showMessage("压缩完成！")
         logger.info("Zip finished")
-        self.show_done(SaveFile)
+        self.zip_path = zippath
+        self.tasks_done()
 
     def onZipError(self, error_msg):
-        # 压缩错误处理
+        # 压缩错误处理，报告照常生成，只是不再嵌入压缩包
         logger.error(f"Error zipping folder: {error_msg}")
-        if hasattr(self, "zip_progressBar"):
-            self.statusBar().removeWidget(self.zip_progressBar)
-            del self.zip_progressBar
+        self.endZip()
         QMessageBox.critical(self, "Error", f"Error zipping folder: {error_msg}")
+        self.tasks_done()
+
+    def onZipCancelled(self):
+        self.endZip()
+        self.tasks_done()
 
 
 if __name__ == "__main__":
+    # 打包后的程序使用进程池时需要
+    multiprocessing.freeze_support()
     app = QApplication()
     win = EMIWindow()
 
@@ -876,4 +1044,4 @@ if __name__ == "__main__":
     win.show()
     sys.exit(app.exec())
 
-    # win.addZipToExcel("FSC048-4C0G", "2.1 Conducted EMI Measurement.xlsx")
+    # win.addZipToExcel("FSC048-4C0G.zip", "2.1 Conducted EMI Measurement.xlsx")
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+EMI报告生成的命令行入口，不加载Qt，可以在构建服务器或计划任务中运行
+
+    python cli.py run --model-dir FSC048-4C0G --loads 4 --jobs 8
+    python cli.py batch --root D:/EMI/2025-01 --jobs 8 --models 3 --max-writes 2
+    python cli.py watch --model-dir FSC048-4C0G
+    python cli.py templates --loads 4
+"""
+import sys
+import time
+import multiprocessing
+import logging
+import argparse
+from datetime import date
+
+from logger import setup_logging
+from core.fileutil import default_workers
+from core.pdfcache import cacheName
+from core.templatecache import templateCacheDir
+from core.imagecache import imageCacheDir
+from core.archive import compressionMethods, DEFLATE_LEVEL
+from core.report import generate_report, build_variants, default_template, ReportError
+from core.batch import run_batch
+from core.watch import DirectoryWatcher
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser():
+    # 项目没有打包安装，命令行只能以 python src/cli.py 运行
+    parser = argparse.ArgumentParser(
+        prog="python src/cli.py", description="ELEKTRA pdf报告转excel报告"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="处理一个机种目录")
+    run.add_argument("--model-dir", required=True, help="机种pdf报告所在目录")
+    add_report_args(run)
+
+    batch = sub.add_parser("batch", help="处理根目录下的所有机种目录")
+    batch.add_argument("--root", required=True, help="包含多个机种目录的根目录")
+    add_report_args(batch)
+    batch.add_argument(
+        "--models", type=int, default=2, help="同时处理的机种数量，默认2"
+    )
+    batch.add_argument(
+        "--max-writes", type=int, default=1, help="同时写入的工作簿数量，默认1"
+    )
+    batch.add_argument(
+        "--summary", help="汇总csv路径，默认为根目录下的 batch_summary.csv"
+    )
+
+    watch = sub.add_parser("watch", help="监视机种目录，导出的pdf稳定后立即解析")
+    watch.add_argument("--model-dir", required=True, help="机种pdf报告所在目录")
+    watch.add_argument(
+        "--jobs", type=int, default=default_workers(), help="pdf解析进程数"
+    )
+    watch.add_argument(
+        "--interval", type=float, default=2.0, help="扫描间隔秒数，默认2"
+    )
+
+    templates = sub.add_parser("templates", help="预先生成模板各单体数量的裁剪版本")
+    templates.add_argument("--template", help="excel模板，默认按负载数量选择")
+    templates.add_argument("--loads", type=int, default=3, help="负载数量，默认3")
+    return parser
+
+
+def add_report_args(parser):
+    parser.add_argument("--template", help="excel模板，默认按负载数量选择")
+    parser.add_argument("--loads", type=int, default=3, help="负载数量，默认3")
+    parser.add_argument(
+        "--jobs", type=int, default=default_workers(), help="pdf解析进程数"
+    )
+    parser.add_argument(
+        "--date", default=date.today().strftime("%Y/%m/%d"), help="测试日期"
+    )
+    parser.add_argument("--workerno", help="工令")
+    parser.add_argument("--rev", help="版本")
+    parser.add_argument("--week", help="D/C")
+    parser.add_argument("--detail", help="测试detail，默认保留模板内容")
+    parser.add_argument("--image", help="测试图片")
+    parser.add_argument(
+        "--output-dir", help="报告和压缩包的保存目录，默认为机种目录的上级目录"
+    )
+    parser.add_argument("--no-zip", action="store_true", help="不生成压缩包")
+    parser.add_argument("--embed", action="store_true", help="把压缩包嵌入excel报告")
+    parser.add_argument(
+        "--embed-engine",
+        choices=["openxml", "excel"],
+        default="openxml",
+        help="嵌入方式: openxml 直接写文件（默认），excel 通过常驻的Excel实例",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["auto"] + list(compressionMethods),
+        default="auto",
+        help="压缩方式，auto 为抽样后自动选择，默认auto",
+    )
+    parser.add_argument(
+        "--zip-level",
+        type=int,
+        default=DEFLATE_LEVEL,
+        help=f"deflate 压缩级别1-9，默认{DEFLATE_LEVEL}",
+    )
+    parser.add_argument(
+        "--full-zip",
+        action="store_true",
+        help="完整重新压缩，默认只压缩新增和改动的pdf",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="不使用解析缓存、模板快照和图片缓存"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        help="每个pdf只保留裕量最小的K行（报告只用第一行），默认保留整张表",
+    )
+
+
+def report_kwargs(args):
+    # run 和 batch 共用的 generate_report 参数
+    return {
+        "template": args.template,
+        "loadqty": args.loads,
+        "header": {
+            "date": args.date,
+            "workerno": args.workerno,
+            "rev": args.rev,
+            "week": args.week,
+            "detail": args.detail,
+        },
+        "img_path": args.image,
+        "need_zip": not args.no_zip,
+        "embed": args.embed,
+        "embed_engine": args.embed_engine,
+        "compression": args.compression,
+        "zip_level": args.zip_level,
+        "zip_incremental": not args.full_zip,
+        "cache_path": None if args.no_cache else cacheName,
+        "template_cache": None if args.no_cache else templateCacheDir,
+        "output_dir": args.output_dir,
+        "image_cache": None if args.no_cache else imageCacheDir,
+        "top_k": args.top_k,
+    }
+
+
+def cmd_run(args):
+    start = time.perf_counter()
+    SaveFile, zippath = generate_report(
+        args.model_dir,
+        workers=args.jobs,
+        progress=lambda done, total: logger.info(f"Parsed {done}/{total}"),
+        **report_kwargs(args),
+    )
+    logger.info(f"Report saved: {SaveFile}")
+    if zippath:
+        logger.info(f"Archive saved: {zippath}")
+    logger.info(f"Finished in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_batch(args):
+    rows = run_batch(
+        args.root,
+        workers=args.jobs,
+        models_parallel=args.models,
+        max_writes=args.max_writes,
+        summary_path=args.summary,
+        **report_kwargs(args),
+    )
+    # 有失败的机种时返回非0，便于计划任务判断
+    return 1 if any(row["status"] != "ok" for row in rows) else 0
+
+
+def cmd_watch(args):
+    # 结果写入解析缓存，测试结束后 run 直接命中缓存；按 Ctrl+C 结束
+    watcher = DirectoryWatcher(args.model_dir, cacheName, args.jobs)
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    logger.info(f"Watch stopped, {len(watcher.results)} files parsed")
+
+
+def cmd_templates(args):
+    template = args.template or default_template(args.loads)
+    start = time.perf_counter()
+    count = build_variants(template, args.loads, templateCacheDir)
+    logger.info(
+        f"{count} variants of {template} cached in {templateCacheDir} "
+        f"({time.perf_counter() - start:.1f}s)"
+    )
+
+
+def main(argv=None):
+    setup_logging(log_dir=".", log_filename="EMIRper.log")
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command == "run":
+            cmd_run(args)
+        elif args.command == "batch":
+            return cmd_batch(args)
+        elif args.command == "watch":
+            cmd_watch(args)
+        elif args.command == "templates":
+            cmd_templates(args)
+    except ReportError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+把模型目录中的pdf报告压缩为zip，不依赖Qt
+"""
+import os
+import json
+import time
+import struct
+import zipfile
+import logging
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+from core.fileutil import content_hash, atomic_path
+from core.manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+# 压缩方式: stored 不压缩，deflate 按 level 压缩，lzma 压缩率最高但最慢，
+# auto 抽样几个文件后自动选择
+compressionMethods = {
+    "stored": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+    "lzma": zipfile.ZIP_LZMA,
+}
+DEFLATE_LEVEL = 6
+AUTO_TIME_BUDGET = 10.0  # auto 时整个压缩包允许的压缩时间（秒）
+AUTO_MIN_SAVING = 0.05  # 更慢的方式至少再减小原大小的5%才选用
+AUTO_SAMPLES = 3  # auto 时抽样压缩的文件数
+
+# 压缩包旁的内容清单 {zipname}.zip.manifest.json，记录每个成员的大小和哈希，
+# 增量压缩时内容未变的成员直接复制上次压缩好的数据
+archiveManifestSuffix = ".manifest.json"
+ARCHIVE_MANIFEST_VERSION = 1
+
+
+def write_member(zf, zinfo, data, method, level=DEFLATE_LEVEL):
+    """按 zinfo 的文件头写入一个成员，结果与 zf.write(原文件) 相同"""
+    zf.writestr(
+        zinfo, data, compress_type=compressionMethods[method], compresslevel=level
+    )
+
+
+def compress_member(zinfo, data, method="lzma", level=DEFLATE_LEVEL):
+    """在内存中把一个文件压缩为只有一个成员的zip，返回zip字节（在进程池中运行）"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        write_member(zf, zinfo, data, method, level)
+    return buffer.getvalue()
+
+
+def choose_method(manifest, level=DEFLATE_LEVEL, workers=1, time_budget=None):
+    """
+    auto 模式: 抽样压缩几个文件，估计每种方式的压缩率和整体耗时
+
+    从 stored 开始，只有估计耗时在 time_budget 内、且比当前选择
+    再减小至少 AUTO_MIN_SAVING 时才换用更慢的方式。
+    已经是Flate压缩的pdf通常选 stored 或 deflate。
+    """
+    if time_budget is None:
+        time_budget = AUTO_TIME_BUDGET
+    entries = manifest.entries
+    total = manifest.total_size()
+    step = max(1, len(entries) // AUTO_SAMPLES)
+    sample = entries[::step][:AUTO_SAMPLES]
+    sample_size = sum(entry.size for entry in sample)
+    if not sample_size:
+        return "stored"
+    chosen, chosen_saving = "stored", 0.0
+    for method in ("deflate", "lzma"):
+        start = time.perf_counter()
+        packed = sum(
+            len(compress_member(e.zipinfo(), manifest.read(e.arcname), method, level))
+            for e in sample
+        )
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        saving = 1 - packed / sample_size
+        estimate = total / (sample_size / elapsed) / max(1, workers)
+        logger.info(
+            f"Zip sample {method}: saves {saving:.1%}, "
+            f"estimated {estimate:.1f}s for {total / 1e6:.1f} MB"
+        )
+        if saving - chosen_saving >= AUTO_MIN_SAVING and estimate <= time_budget:
+            chosen, chosen_saving = method, saving
+    return chosen
+
+
+def raw_member(src, zinfo):
+    """读取打开的压缩包 src 中一个成员压缩后的数据"""
+    # 本地文件头: 30字节固定部分 + 文件名 + 扩展字段
+    src.fp.seek(zinfo.header_offset + 26)
+    name_len, extra_len = struct.unpack("<HH", src.fp.read(4))
+    src.fp.seek(zinfo.header_offset + 30 + name_len + extra_len)
+    return src.fp.read(zinfo.compress_size)
+
+
+def add_compressed(zf, member_zip):
+    """把 compress_member 得到的成员原样写入打开的 zf，不再重新压缩"""
+    with zipfile.ZipFile(BytesIO(member_zip)) as src:
+        zinfo = src.infolist()[0]
+        data = raw_member(src, zinfo)
+    add_raw(zf, zinfo, data)
+
+
+def add_raw(zf, zinfo, data):
+    """
+    把已压缩的数据 data 按 zinfo 写入打开的 zf
+
+    zipfile 没有公开写入已压缩数据的接口，这里按 ZipFile.write 的方式
+    写本地文件头和数据，并登记到中央目录
+    """
+    zf.fp.seek(zf.start_dir)
+    zinfo.header_offset = zf.fp.tell()
+    zf._writecheck(zinfo)
+    zf._didModify = True
+    zf.fp.write(zinfo.FileHeader())
+    zf.fp.write(data)
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = zf.fp.tell()
+
+
+def reused_info(entry, old):
+    """上次压缩的成员 old 的压缩信息 + 本次扫描的文件头（修改时间、权限）"""
+    zinfo = entry.zipinfo()
+    for attr in ("compress_type", "flag_bits", "CRC", "compress_size", "file_size"):
+        setattr(zinfo, attr, getattr(old, attr))
+    return zinfo
+
+
+def read_archive_manifest(zippath):
+    """读取压缩包旁的内容清单，不存在、版本不符或压缩包已被改动时返回 None"""
+    try:
+        with open(zippath + archiveManifestSuffix, encoding="utf-8") as f:
+            previous = json.load(f)
+        st = os.stat(zippath)
+    except (OSError, ValueError):
+        return None
+    if previous.get("version") != ARCHIVE_MANIFEST_VERSION:
+        return None
+    if previous["archive"] != {"size": st.st_size, "mtime_ns": st.st_mtime_ns}:
+        logger.info(f"Archive changed since its manifest was written: {zippath}")
+        return None
+    return previous
+
+
+def write_archive_manifest(zippath, method, level, manifest, hashes):
+    st = os.stat(zippath)
+    data = {
+        "version": ARCHIVE_MANIFEST_VERSION,
+        "method": method,
+        "level": level,
+        "archive": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "members": {
+            entry.arcname: {
+                "size": entry.size,
+                "mtime_ns": entry.mtime_ns,
+                "sha256": hashes[entry.arcname],
+            }
+            for entry in manifest.entries
+        },
+    }
+    try:
+        with atomic_path(zippath + archiveManifestSuffix) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        logger.warning(f"Failed to save archive manifest: {e}")
+
+
+def unchanged_members(previous, old_zip, manifest, hashes):
+    """
+    返回 {包内路径: 上次压缩的 ZipInfo}，这些文件与上次压缩时内容相同
+
+    大小和修改时间一致时直接认为未变；修改时间不同时再比较内容哈希。
+    未变文件的哈希沿用清单中的记录，写入 hashes
+    """
+    members = previous["members"]
+    reuse = {}
+    for entry in manifest.entries:
+        record = members.get(entry.arcname)
+        old = old_zip.NameToInfo.get(entry.zipinfo().filename)
+        if record is None or old is None or record["size"] != entry.size:
+            continue
+        if record["mtime_ns"] != entry.mtime_ns:
+            if record["sha256"] != content_hash(manifest.read(entry.arcname)):
+                continue
+        reuse[entry.arcname] = old
+        hashes[entry.arcname] = record["sha256"]
+    return reuse
+
+
+def zip_folder(
+    directory,
+    zipname,
+    progress=None,
+    workers=1,
+    pool=None,
+    method="lzma",
+    level=DEFLATE_LEVEL,
+    time_budget=None,
+    manifest=None,
+    incremental=False,
+):
+    """
+    压缩 directory 下所有pdf到 {zipname}.zip，包内路径相对于 directory
+
+    zipname 相对路径时相对于当前工作目录，多任务同时运行时应传入绝对路径。
+    workers > 1 或传入 pool 时各文件在进程池中并行压缩，再按顺序拼成同样的zip。
+    method 为 compressionMethods 中的压缩方式或 "auto"，level 为 deflate 的压缩级别，
+    time_budget 为 auto 时允许的压缩时间；
+    manifest 为 directory 的 Manifest，与解析共用已读入的文件内容，
+    None 时扫描目录并逐个读取。
+    压缩包旁总是写入内容清单；incremental 为 True 且压缩方式不变时，
+    内容未变的文件直接复制上次压缩的数据，只压缩新增和改动的文件，
+    结果与完整重新压缩相同。auto 时沿用上次的压缩方式。
+    progress(i) 在每个文件写入后调用；返回zip文件路径
+    """
+    if manifest is None:
+        with Manifest(directory) as manifest:
+            return zip_folder(
+                directory,
+                zipname,
+                progress,
+                workers,
+                pool,
+                method,
+                level,
+                time_budget,
+                manifest,
+                incremental,
+            )
+    pdf_files = manifest.entries
+    zippath = f"{zipname}.zip"
+
+    start = time.perf_counter()
+    previous = read_archive_manifest(zippath) if incremental else None
+    if method == "auto":
+        if previous is not None:
+            method = previous["method"]
+        else:
+            method = choose_method(manifest, level, workers, time_budget)
+    elif method not in compressionMethods:
+        raise ValueError(f"Unknown compression method: {method}")
+    if previous is not None and (previous["method"], previous["level"]) != (
+        method,
+        level,
+    ):
+        logger.info("Compression settings changed, rebuilding the whole archive.")
+        previous = None
+
+    hashes = {}  # 包内路径 -> 内容哈希，写入新的内容清单
+    reuse = {}
+    old_zip = None
+    if previous is not None:
+        try:
+            old_zip = zipfile.ZipFile(zippath)
+            reuse = unchanged_members(previous, old_zip, manifest, hashes)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning(f"Cannot reuse {zippath}, rebuilding: {e}")
+            if old_zip is not None:
+                old_zip.close()
+            old_zip, reuse = None, {}
+            hashes.clear()
+    changed = [entry for entry in pdf_files if entry.arcname not in reuse]
+    for entry in changed:
+        hashes[entry.arcname] = content_hash(manifest.read(entry.arcname))
+
+    # 执行压缩操作
+    if previous is not None:
+        logger.info(
+            f"Zipping {len(changed)} changed files ({method}), "
+            f"reusing {len(reuse)} unchanged..."
+        )
+    else:
+        logger.info(f"Zipping {len(pdf_files)} files ({method})...")
+    # 先写临时文件再替换，同时运行的任务不会看到写了一半的压缩包
+    with atomic_path(zippath) as tmp_path:
+        with zipfile.ZipFile(tmp_path, "w") as harZip:
+            try:
+                # 不压缩时只是复制数据，不值得交给进程池
+                if method == "stored" or (
+                    pool is None and (workers <= 1 or len(changed) <= 1)
+                ):
+                    _zip_members(
+                        harZip, manifest, reuse, old_zip, progress, method, level
+                    )
+                elif pool is not None:
+                    _zip_members(
+                        harZip, manifest, reuse, old_zip, progress, method, level, pool
+                    )
+                else:
+                    with ProcessPoolExecutor(
+                        max_workers=min(workers, len(changed))
+                    ) as pool:
+                        _zip_members(
+                            harZip,
+                            manifest,
+                            reuse,
+                            old_zip,
+                            progress,
+                            method,
+                            level,
+                            pool,
+                        )
+            finally:
+                # 替换之前关闭旧压缩包（Windows 下打开的文件不能被替换）
+                if old_zip is not None:
+                    old_zip.close()
+    write_archive_manifest(zippath, method, level, manifest, hashes)
+
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    original = manifest.total_size()
+    packed = os.path.getsize(zippath)
+    logger.info(
+        f"Zipped {len(pdf_files)} files with {method}: "
+        f"{original / 1e6:.1f} MB -> {packed / 1e6:.1f} MB "
+        f"({packed / max(original, 1):.1%}) in {elapsed:.1f}s, "
+        f"{original / 1e6 / elapsed:.1f} MB/s"
+    )
+    return zippath
+
+
+def _zip_members(zf, manifest, reuse, old_zip, progress, method, level, pool=None):
+    """按目录顺序写入所有成员：复制未变的成员，压缩其余成员（传入 pool 时并行）"""
+    futures = {}
+    if pool is not None:
+        futures = {
+            entry.arcname: pool.submit(
+                compress_member,
+                entry.zipinfo(),
+                manifest.read(entry.arcname),
+                method,
+                level,
+            )
+            for entry in manifest.entries
+            if entry.arcname not in reuse
+        }
+    try:
+        # 按目录顺序写入，包内顺序与单进程压缩相同
+        for i, entry in enumerate(manifest.entries):
+            old = reuse.get(entry.arcname)
+            if old is not None:
+                add_raw(zf, reused_info(entry, old), raw_member(old_zip, old))
+            elif pool is not None:
+                add_compressed(zf, futures[entry.arcname].result())
+            else:
+                write_member(
+                    zf, entry.zipinfo(), manifest.read(entry.arcname), method, level
+                )
+            if progress is not None:
+                progress(i + 1)
+    finally:
+        for future in futures.values():
+            future.cancel()
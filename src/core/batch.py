@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+对根目录下的多个机种目录批量生成报告，不依赖Qt
+"""
+import os
+import csv
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from core.pdfparse import list_pdfs
+from core.report import generate_report
+
+logger = logging.getLogger(__name__)
+
+summaryName = "batch_summary.csv"
+
+
+def discover_models(root):
+    """返回 root 下包含pdf报告的子目录（机种目录，如 FSC048-4C0G），按名称排序"""
+    models = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and list_pdfs(path):
+            models.append(path)
+    return models
+
+
+def run_batch(
+    root,
+    workers=1,
+    models_parallel=2,
+    max_writes=1,
+    summary_path=None,
+    **report_kwargs,
+):
+    """
+    批量处理 root 下的所有机种目录，每个机种生成一份excel报告和zip压缩包
+
+    所有机种共用一个 workers 进程的解析进程池；同时处理 models_parallel 个机种，
+    其中最多 max_writes 个同时打开工作簿。report_kwargs 传给 generate_report。
+    返回每个机种的处理结果列表，并写入 summary_path（默认 root/batch_summary.csv）
+    """
+    models = discover_models(root)
+    logger.info(f"Batch: {len(models)} models found in {root}")
+    write_slots = threading.BoundedSemaphore(max(1, max_writes))
+
+    def run_one(model_dir):
+        row = {
+            "model": os.path.basename(model_dir),
+            "files": len(list_pdfs(model_dir)),
+            "status": "ok",
+            "seconds": 0.0,
+            "report": "",
+            "archive": "",
+            "error": "",
+        }
+        start = time.perf_counter()
+        try:
+            SaveFile, zippath = generate_report(
+                model_dir, pool=pool, write_slots=write_slots, **report_kwargs
+            )
+            row["report"] = SaveFile
+            row["archive"] = zippath or ""
+        except Exception as e:
+            logger.error(f"Batch: {row['model']} failed: {e}")
+            row["status"] = "failed"
+            row["error"] = str(e)
+        row["seconds"] = round(time.perf_counter() - start, 2)
+        logger.info(f"Batch: {row['model']} {row['status']} in {row['seconds']}s")
+        return row
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        with ThreadPoolExecutor(max_workers=max(1, models_parallel)) as models_pool:
+            rows = list(models_pool.map(run_one, models))
+    total = time.perf_counter() - start
+
+    summary_path = summary_path or os.path.join(root, summaryName)
+    write_summary(summary_path, rows, total)
+    failed = sum(1 for row in rows if row["status"] != "ok")
+    logger.info(
+        f"Batch finished: {len(rows) - failed} ok, {failed} failed in {total:.1f}s, "
+        f"summary: {summary_path}"
+    )
+    return rows
+
+
+def write_summary(summary_path, rows, total):
+    fields = ["model", "files", "status", "seconds", "report", "archive", "error"]
+    with open(summary_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+        writer.writerow(
+            {
+                "model": "TOTAL",
+                "files": sum(r["files"] for r in rows),
+                "seconds": round(total, 2),
+            }
+        )
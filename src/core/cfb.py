@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+复合文档（Compound File Binary, OLE2）写入，用于生成嵌入excel的OLE对象
+
+只支持根存储下的一层流，按 [MS-CFB] 第3版（512字节扇区）写入
+"""
+import struct
+
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 4096  # 小于此大小的流保存在迷你流中
+HEADER_DIFAT = 109  # 文件头中保存的FAT扇区位置数
+
+DIFSECT = 0xFFFFFFFC
+FATSECT = 0xFFFFFFFD
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+NOSTREAM = 0xFFFFFFFF
+
+SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def _sectors(size, sector_size=SECTOR_SIZE):
+    return (size + sector_size - 1) // sector_size
+
+
+def _pad(data, sector_size=SECTOR_SIZE):
+    return data + b"\x00" * (-len(data) % sector_size)
+
+
+def _chain(table, start, count):
+    # 连续的 count 个扇区组成一条链
+    for i in range(start, start + count - 1):
+        table[i] = i + 1
+    if count:
+        table[start + count - 1] = ENDOFCHAIN
+
+
+def _entry_key(name):
+    # 目录项的排序: 先比较长度，再逐字符比较大写形式
+    return len(name), name.upper()
+
+
+def _tree(order, lo, hi, links):
+    """把已排序的目录项 order[lo:hi] 组织成平衡二叉树，返回根的目录项编号"""
+    if lo >= hi:
+        return NOSTREAM
+    mid = (lo + hi) // 2
+    links[order[mid]] = (_tree(order, lo, mid, links), _tree(order, mid + 1, hi, links))
+    return order[mid]
+
+
+def _dir_entry(name, kind, left, right, child, clsid, start, size):
+    encoded = (name + "\x00").encode("utf-16-le")
+    return struct.pack(
+        "<64sHBBIII16sIQQIQ",
+        encoded,
+        len(encoded) if name else 0,
+        kind,
+        1,  # 全部为黑色节点
+        left,
+        right,
+        child,
+        clsid,
+        0,
+        0,
+        0,
+        start,
+        size,
+    )
+
+
+def write_cfb(streams, clsid=b"\x00" * 16):
+    """
+    streams 为 [(流名称, 字节)]，clsid 为根存储的类标识（16字节，小端格式）
+
+    返回复合文档的字节
+    """
+    # 小于 MINI_STREAM_CUTOFF 的流放入迷你流，以64字节为单位分配
+    mini_stream = b""
+    mini_fat = []
+    placed = []  # (名称, 起始扇区, 大小, 是否在迷你流中)
+    big = []
+    for name, data in streams:
+        if len(data) < MINI_STREAM_CUTOFF:
+            start = len(mini_stream) // MINI_SECTOR_SIZE
+            count = _sectors(len(data), MINI_SECTOR_SIZE)
+            mini_fat.extend([FREESECT] * count)
+            _chain(mini_fat, start, count)
+            mini_stream += _pad(data, MINI_SECTOR_SIZE)
+            placed.append((name, start if data else ENDOFCHAIN, len(data)))
+        else:
+            big.append((name, data))
+            placed.append((name, None, len(data)))
+
+    # 普通扇区依次为: 大流、迷你流容器、迷你FAT、目录，之后是FAT和DIFAT
+    body = []
+    next_sector = 0
+    big_start = {}
+    for name, data in big:
+        big_start[name] = next_sector
+        body.append((next_sector, _pad(data)))
+        next_sector += _sectors(len(data))
+    mini_stream_start = next_sector if mini_stream else ENDOFCHAIN
+    body.append((next_sector, _pad(mini_stream)))
+    next_sector += _sectors(len(mini_stream))
+
+    mini_fat_bytes = b"".join(struct.pack("<I", x) for x in mini_fat)
+    mini_fat_bytes += struct.pack("<I", FREESECT) * (-len(mini_fat) % 128)
+    mini_fat_start = next_sector if mini_fat else ENDOFCHAIN
+    mini_fat_count = _sectors(len(mini_fat_bytes))
+    body.append((next_sector, mini_fat_bytes))
+    next_sector += mini_fat_count
+
+    # 目录项: 0 为根存储，其余为各个流
+    names = [name for name, _, _ in placed]
+    order = sorted(range(1, len(names) + 1), key=lambda i: _entry_key(names[i - 1]))
+    links = {}
+    child = _tree(order, 0, len(order), links)
+    entries = [
+        _dir_entry(
+            "Root Entry",
+            5,
+            NOSTREAM,
+            NOSTREAM,
+            child,
+            clsid,
+            mini_stream_start,
+            len(mini_stream),
+        )
+    ]
+    for i, (name, start, size) in enumerate(placed, 1):
+        if start is None:
+            start = big_start[name]
+        left, right = links[i]
+        entries.append(
+            _dir_entry(name, 2, left, right, NOSTREAM, b"\x00" * 16, start, size)
+        )
+    while len(entries) % (SECTOR_SIZE // 128):
+        entries.append(
+            _dir_entry("", 0, NOSTREAM, NOSTREAM, NOSTREAM, b"\x00" * 16, 0, 0)
+        )
+    dir_start = next_sector
+    dir_bytes = b"".join(entries)
+    body.append((next_sector, dir_bytes))
+    next_sector += _sectors(len(dir_bytes))
+
+    # FAT本身也占用扇区，反复计算直到扇区数不再变化
+    fat_count = difat_count = 0
+    while True:
+        total = next_sector + fat_count + difat_count
+        need_fat = _sectors(total * 4)
+        need_difat = _sectors(max(0, need_fat - HEADER_DIFAT) * 4, SECTOR_SIZE - 4)
+        if (need_fat, need_difat) == (fat_count, difat_count):
+            break
+        fat_count, difat_count = need_fat, need_difat
+    fat_start = next_sector
+    difat_start = fat_start + fat_count
+
+    fat = [FREESECT] * (fat_count * SECTOR_SIZE // 4)
+    for name, data in big:
+        _chain(fat, big_start[name], _sectors(len(data)))
+    if mini_stream:
+        _chain(fat, mini_stream_start, _sectors(len(mini_stream)))
+    if mini_fat:
+        _chain(fat, mini_fat_start, mini_fat_count)
+    _chain(fat, dir_start, _sectors(len(dir_bytes)))
+    for i in range(fat_start, difat_start):
+        fat[i] = FATSECT
+    for i in range(difat_start, difat_start + difat_count):
+        fat[i] = DIFSECT
+    body.append((fat_start, b"".join(struct.pack("<I", x) for x in fat)))
+
+    fat_sectors = list(range(fat_start, difat_start))
+    rest = fat_sectors[HEADER_DIFAT:]
+    per_sector = SECTOR_SIZE // 4 - 1
+    difat = b""
+    for i in range(difat_count):
+        chunk = rest[i * per_sector : (i + 1) * per_sector]
+        chunk += [FREESECT] * (per_sector - len(chunk))
+        chunk.append(difat_start + i + 1 if i + 1 < difat_count else ENDOFCHAIN)
+        difat += b"".join(struct.pack("<I", x) for x in chunk)
+    body.append((difat_start, difat))
+
+    head = fat_sectors[:HEADER_DIFAT]
+    head += [FREESECT] * (HEADER_DIFAT - len(head))
+    header = struct.pack(
+        "<8s16sHHHHH6sIIIIIIIII",
+        SIGNATURE,
+        b"\x00" * 16,
+        0x003E,  # 次版本号
+        0x0003,  # 主版本号3，512字节扇区
+        0xFFFE,  # 小端
+        9,  # 扇区大小 2^9
+        6,  # 迷你扇区大小 2^6
+        b"\x00" * 6,
+        0,  # 第3版目录扇区数必须为0
+        fat_count,
+        dir_start,
+        0,
+        MINI_STREAM_CUTOFF,
+        mini_fat_start,
+        mini_fat_count,
+        difat_start if difat_count else ENDOFCHAIN,
+        difat_count,
+    )
+    header += b"".join(struct.pack("<I", x) for x in head)
+    return header + b"".join(data for _, data in sorted(body))
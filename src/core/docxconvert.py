@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+DOCX 转 PDF：多个独立的 Word 工作进程并行转换，不依赖Qt
+
+每个工作进程有自己的COM套间和Word实例，从共享的待转换队列中依次领取文件。
+转换失败的文件交给其他没有失败过的工作进程重试；超过 timeout 没有完成的
+工作进程连同它的 WINWORD.EXE 被结束，工作进程随后重启。
+转换器实现 Converter 的接口，可以换成不需要Word的 FakeConverter。
+增量模式下，docx旁的转换清单记录每个文件转换时的内容和输出，只转换新增或修改过的文件。
+"""
+import os
+import abc
+import json
+import time
+import signal
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+
+from core.fileutil import default_workers, file_hash, atomic_path
+
+logger = logging.getLogger(__name__)
+
+CONVERT_TIMEOUT = 180  # 单个文件的转换时限（秒），超时视为Word卡死
+wdFormatPDF = 17
+
+convertManifestName = "docx2pdf.manifest.json"
+CONVERT_MANIFEST_VERSION = 1
+
+
+def list_docx(docx_dir):
+    # 跳过Word打开文档时生成的 ~$ 临时文件
+    return [
+        f
+        for f in os.listdir(docx_dir)
+        if f.endswith(".docx") and not f.startswith("~$")
+    ]
+
+
+def pdf_name(docx_file):
+    return os.path.splitext(docx_file)[0] + ".pdf"
+
+
+class Converter(abc.ABC):
+    """
+    转换器的接口，在工作进程中创建
+
+    start() 和 quit() 各调用一次，管理一个实例的生命周期；
+    convert(src, dst) 在两者之间调用，失败时抛出异常。
+    start() 启动了独立的外部进程时把进程号记在 pid 中，卡死时主进程一并结束它
+    """
+
+    pid = None
+
+    @abc.abstractmethod
+    def start(self):
+        pass
+
+    @abc.abstractmethod
+    def quit(self):
+        pass
+
+    @abc.abstractmethod
+    def convert(self, src, dst):
+        pass
+
+
+class FakeConverter(Converter):
+    """
+    不需要Word的假转换器，用于测试 ConverterPool 和增量转换
+
+    dst 中写入 src 的文件名和工作进程号；定义在模块级，可以传给 spawn 的工作进程。
+    src 的内容决定转换的结果，用来模拟Word的各种故障：
+    "error" 总是失败，"error once" 只在第一次失败，"hang once" 第一次卡住 HANG_SECONDS 秒，
+    其他内容直接成功。"once" 通过 src 旁的标记文件记录，重试在其他进程中也能看到。
+    """
+
+    HANG_SECONDS = 60
+
+    def start(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def convert(self, src, dst):
+        with open(src, encoding="utf-8") as f:
+            action = f.read().strip()
+        if action.endswith(" once"):
+            marker = src + ".tried"
+            if os.path.exists(marker):
+                action = ""
+            else:
+                open(marker, "w").close()
+                action = action[: -len(" once")]
+        if action == "error":
+            raise RuntimeError(f"cannot convert {os.path.basename(src)}")
+        if action == "hang":
+            time.sleep(self.HANG_SECONDS)
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(f"{os.path.basename(src)} {os.getpid()}")
+
+
+class WordConverter(Converter):
+    """通过 pywin32 控制一个独立的、不可见的 Word 实例"""
+
+    def __init__(self):
+        self.word = None
+
+    def start(self):
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        # DispatchEx 总是启动新实例，各工作进程互不影响
+        self.word = win32.DispatchEx("Word.Application")
+        self.word.Visible = False
+        self.word.DisplayAlerts = 0
+        try:
+            import win32process
+
+            # WINWORD.EXE 是独立进程，结束工作进程时不会随之退出
+            self.pid = win32process.GetWindowThreadProcessId(self.word.Hwnd)[1]
+        except Exception as e:
+            logger.warning(f"Cannot get the Word process id: {e}")
+
+    def quit(self):
+        import pythoncom
+
+        try:
+            if self.word is not None:
+                self.word.Quit()
+        finally:
+            self.word = None
+            self.pid = None
+            pythoncom.CoUninitialize()
+
+    def convert(self, src, dst):
+        doc = self.word.Documents.Open(os.path.abspath(src), ReadOnly=True)
+        try:
+            doc.SaveAs(os.path.abspath(dst), FileFormat=wdFormatPDF)
+        finally:
+            # 不保存退出
+            doc.Close(SaveChanges=False)
+
+
+def _worker_main(converter_factory, conn):
+    """
+    工作进程: 逐个接收 (src, dst)，回复 ("result", 成功, 错误信息)，收到 None 时退出
+
+    启动或退出转换器后先发送 ("pid", 外部进程号或None)
+    """
+    converter = None
+    try:
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            try:
+                if converter is None:
+                    converter = converter_factory()
+                    converter.start()
+                    conn.send(("pid", converter.pid))
+                converter.convert(*job)
+            except Exception as e:
+                # 出错后换一个新实例，避免Word停在异常状态
+                converter = _quit(converter)
+                conn.send(("pid", None))
+                conn.send(("result", False, f"{type(e).__name__}: {e}"))
+            else:
+                conn.send(("result", True, ""))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        _quit(converter)
+
+
+def _quit(converter):
+    if converter is not None:
+        try:
+            converter.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit converter: {e}")
+    return None
+
+
+class _Worker:
+    """主进程中对一个工作进程的记录"""
+
+    def __init__(self, slot, converter_factory, ctx):
+        self.slot = slot
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(converter_factory, child),
+            name=f"converter-{slot}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.job = None  # 正在转换的 _Job
+        self.started = 0.0
+        self.app_pid = None  # 转换器启动的外部进程（WINWORD.EXE）
+
+    def send(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.conn.send((job.src, job.dst))
+
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill_app(self):
+        """结束卡死或崩溃的工作进程留下的外部进程，否则它会一直占用内存和文件"""
+        pid, self.app_pid = self.app_pid, None
+        if pid is None:
+            return
+        try:
+            # Windows 下 os.kill 调用 TerminateProcess
+            os.kill(pid, signal.SIGTERM)
+            logger.info(f"Killed orphaned converter process {pid}")
+        except OSError as e:
+            logger.warning(f"Failed to kill converter process {pid}: {e}")
+
+
+class _Job:
+    __slots__ = ("src", "dst", "failed", "error")
+
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+        self.failed = set()  # 失败过的工作进程编号
+        self.error = None
+
+
+class ConverterPool:
+    """
+    workers 个转换进程，iter_convert 按完成顺序产出结果
+
+    converter_factory() 在工作进程中返回 Converter，须能被pickle（模块级的类或函数）；
+    每个文件最多在 workers 个不同的进程中各尝试一次；
+    timeout 为单个文件的时限，超时的进程连同转换器的外部进程被结束，再在同一位置重启。
+    """
+
+    def __init__(
+        self, converter_factory=WordConverter, workers=None, timeout=CONVERT_TIMEOUT
+    ):
+        self.converter_factory = converter_factory
+        self.workers = workers or default_workers()
+        self.timeout = timeout
+        self.restarts = 0  # 因超时重启的次数
+        self._ctx = multiprocessing.get_context("spawn")
+        self._slots = [None] * self.workers
+
+    def _worker(self, slot):
+        worker = self._slots[slot]
+        if worker is None or not worker.process.is_alive():
+            if worker is not None:
+                worker.kill()
+            worker = self._slots[slot] = _Worker(
+                slot, self.converter_factory, self._ctx
+            )
+        return worker
+
+    def iter_convert(self, jobs, should_stop=None):
+        """
+        jobs 为 [(docx路径, pdf路径)]，按完成顺序产出 (docx路径, pdf路径, 错误信息)
+
+        错误信息为 None 表示转换成功；should_stop() 返回 True 时不再分配新文件，
+        等待正在转换的文件完成后结束
+        """
+        pending = deque(_Job(src, dst) for src, dst in jobs)
+        busy = {}  # 连接 -> _Worker
+        while pending or busy:
+            if should_stop is not None and should_stop():
+                pending.clear()
+            # 给每个空闲的进程分配一个它没有失败过的文件
+            for slot in range(self.workers):
+                worker = self._slots[slot]
+                if worker is not None and worker.job is not None:
+                    continue
+                job = next((j for j in pending if slot not in j.failed), None)
+                if job is None:
+                    continue
+                pending.remove(job)
+                worker = self._worker(slot)
+                worker.send(job)
+                busy[worker.conn] = worker
+
+            for conn in wait(list(busy), timeout=1.0):
+                worker = busy[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    message = ("result", False, "converter process exited")
+                    worker.kill()
+                    worker.kill_app()
+                    self._slots[worker.slot] = None
+                if message[0] == "pid":
+                    worker.app_pid = message[1]
+                    continue
+                del busy[conn]
+                job, worker.job = worker.job, None
+                _, ok, error = message
+                result = self._finish(job, worker.slot, ok, error, pending)
+                if result is not None:
+                    yield result
+
+            now = time.monotonic()
+            for conn, worker in list(busy.items()):
+                if now - worker.started < self.timeout:
+                    continue
+                logger.warning(
+                    f"Converter {worker.slot} timed out on {worker.job.src}, restarting"
+                )
+                del busy[conn]
+                job, worker.job = worker.job, None
+                worker.kill()
+                worker.kill_app()
+                self._slots[worker.slot] = None
+                self.restarts += 1
+                result = self._finish(
+                    job, worker.slot, False, f"timed out after {self.timeout}s", pending
+                )
+                if result is not None:
+                    yield result
+
+    def _finish(self, job, slot, ok, error, pending):
+        """记录一次转换结果，需要重试时放回队列并返回 None"""
+        if ok:
+            logger.info(f"Converted {job.src} to PDF.")
+            return job.src, job.dst, None
+        job.failed.add(slot)
+        job.error = error
+        if len(job.failed) < self.workers:
+            logger.warning(f"Converter {slot} failed on {job.src}: {error}, retrying")
+            # 放在队首，由下一个空闲的其他进程优先处理
+            pending.appendleft(job)
+            return None
+        logger.error(f"Error converting {job.src} to PDF: {error}")
+        return job.src, job.dst, error
+
+    def close(self):
+        for slot, worker in enumerate(self._slots):
+            if worker is not None:
+                worker.stop()
+                self._slots[slot] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_jobs(docx_path):
+    """docx_path 为文件夹时转换其中所有docx，为文件时只转换该文件；pdf放在docx旁边"""
+    docx_path = os.path.abspath(docx_path)
+    if os.path.isdir(docx_path):
+        files = [os.path.join(docx_path, f) for f in list_docx(docx_path)]
+    else:
+        files = [docx_path]
+    return [(f, pdf_name(f)) for f in files]
+
+
+def manifest_dir(docx_path):
+    """转换清单所在的目录: 文件夹本身，或单个文件所在的目录"""
+    docx_path = os.path.abspath(docx_path)
+    return docx_path if os.path.isdir(docx_path) else os.path.dirname(docx_path)
+
+
+def read_convert_manifest(directory):
+    """读取目录中的转换清单，返回 {docx文件名: 记录}，不存在或版本不符时返回空字典"""
+    try:
+        with open(os.path.join(directory, convertManifestName), encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if previous.get("version") != CONVERT_MANIFEST_VERSION:
+        return {}
+    return previous["files"]
+
+
+def write_convert_manifest(directory, records):
+    data = {"version": CONVERT_MANIFEST_VERSION, "files": records}
+    try:
+        with atomic_path(os.path.join(directory, convertManifestName)) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        logger.warning(f"Failed to save convert manifest: {e}")
+
+
+def _up_to_date(record, src, dst):
+    """
+    上次转换后docx内容未变、pdf也没有被替换或删除时返回 True
+
+    docx的大小和修改时间一致时直接认为未变；修改时间不同时再比较内容哈希，
+    内容相同则更新记录中的修改时间
+    """
+    try:
+        st = os.stat(src)
+        out = os.stat(dst)
+    except OSError:
+        return False
+    if record["pdf"] != os.path.basename(dst):
+        return False
+    if (out.st_size, out.st_mtime_ns) != (record["pdf_size"], record["pdf_mtime_ns"]):
+        return False
+    if st.st_size != record["size"]:
+        return False
+    if st.st_mtime_ns != record["mtime_ns"]:
+        if file_hash(src) != record["sha256"]:
+            return False
+        record["mtime_ns"] = st.st_mtime_ns
+    return True
+
+
+def plan_incremental(directory, jobs, incremental=True):
+    """
+    按目录中的转换清单筛选 jobs，incremental 为 False 时全部需要转换
+
+    返回 (需要转换的 jobs, 跳过的 jobs, 跳过的文件上次转换所用的时间, 清单记录)；
+    清单记录保留跳过的文件和不在 jobs 中的文件（只转换单个文件时），
+    转换完成后用 record_conversion 补充
+    """
+    previous = read_convert_manifest(directory)
+    names = {os.path.basename(src) for src, _ in jobs}
+    records = {k: v for k, v in previous.items() if k not in names}
+    todo, skipped = [], []
+    saved = 0.0
+    if not incremental:
+        return list(jobs), skipped, saved, records
+    for src, dst in jobs:
+        name = os.path.basename(src)
+        record = previous.get(name)
+        if record is not None and _up_to_date(record, src, dst):
+            skipped.append((src, dst))
+            records[name] = record
+            saved += record["seconds"]
+        else:
+            todo.append((src, dst))
+    return todo, skipped, saved, records
+
+
+def record_conversion(records, src, dst, seconds):
+    """记录转换成功的文件，seconds 为这个文件平均占用的转换时间"""
+    try:
+        st = os.stat(src)
+        out = os.stat(dst)
+        sha256 = file_hash(src)
+    except OSError as e:
+        logger.warning(f"Failed to record conversion of {src}: {e}")
+        return
+    records[os.path.basename(src)] = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha256,
+        "pdf": os.path.basename(dst),
+        "pdf_size": out.st_size,
+        "pdf_mtime_ns": out.st_mtime_ns,
+        "seconds": seconds,
+    }
+
+
+class ConvertPlan:
+    """
+    docx_path 中需要转换的文件
+
+    incremental 为 True 时按转换清单跳过未修改的文件，为 False 时全部重新转换。
+    todo 为需要转换的 (docx路径, pdf路径)，skipped 为跳过的，
+    saved 为跳过的文件上次转换所用的时间（秒）
+    """
+
+    def __init__(self, docx_path, incremental=True):
+        self.directory = manifest_dir(docx_path)
+        self.todo, self.skipped, self.saved, self.records = plan_incremental(
+            self.directory, convert_jobs(docx_path), incremental
+        )
+        logger.info(
+            f"{len(self.todo)} to convert, {len(self.skipped)} unchanged skipped "
+            f"(about {self.saved:.1f}s saved)"
+        )
+
+    def run(self, pool, should_stop=None):
+        """
+        用 pool 转换 todo，按完成顺序产出 iter_convert 的结果，结束后更新转换清单
+
+        每个文件的转换时间记为本次总耗时除以成功转换的文件数，即并行后的实际耗时
+        """
+        converted = []
+        start = time.perf_counter()
+        try:
+            for src, dst, err in pool.iter_convert(self.todo, should_stop):
+                if err is None:
+                    converted.append((src, dst))
+                yield src, dst, err
+        finally:
+            # 中途取消时也记录已转换的文件
+            seconds = (time.perf_counter() - start) / max(len(converted), 1)
+            for src, dst in converted:
+                record_conversion(self.records, src, dst, seconds)
+            write_convert_manifest(self.directory, self.records)
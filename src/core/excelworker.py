@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+常驻的 Excel 自动化线程：保持一个Excel实例，多份报告依次复用，不依赖Qt
+
+所有COM调用都在同一个专用线程（单线程套间）中进行，调用方通过队列提交任务。
+后端实现 ExcelBackend 的接口，测试时可以换成不启动Excel的 FakeExcelBackend。
+"""
+import os
+import abc
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 20  # 每个Excel实例最多处理的任务数，之后重启以释放内存
+
+
+class ExcelBackend(abc.ABC):
+    """
+    Excel 自动化后端的接口
+
+    start() 和 quit() 在工作线程中各调用一次，管理一个实例的生命周期；
+    任务方法（如 embed_zip）在两者之间调用，返回值作为任务结果
+    """
+
+    @abc.abstractmethod
+    def start(self):
+        pass
+
+    @abc.abstractmethod
+    def quit(self):
+        pass
+
+    @abc.abstractmethod
+    def embed_zip(self, SaveFile, zippath, row_sn, col_end):
+        """把压缩包作为对象插入报告的 (row_sn, col_end - 2) 单元格"""
+
+
+class FakeExcelBackend(ExcelBackend):
+    """不启动Excel的假后端，只检查文件并记录调用，用于测试 ExcelWorker"""
+
+    def __init__(self):
+        self.running = False
+        self.embedded = []  # 已处理的 (报告路径, 压缩包路径, 行, 列)
+
+    def start(self):
+        self.running = True
+
+    def quit(self):
+        self.running = False
+
+    def embed_zip(self, SaveFile, zippath, row_sn, col_end):
+        if not self.running:
+            raise RuntimeError("Backend is not started")
+        for path in (SaveFile, zippath):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+        self.embedded.append((SaveFile, zippath, row_sn, col_end))
+
+
+class ComExcelBackend(ExcelBackend):
+    """通过 pywin32 控制一个独立的、不可见的 Excel 实例"""
+
+    def __init__(self):
+        self.excel = None
+
+    def start(self):
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        # DispatchEx 总是启动新实例，不会接管用户正在使用的Excel
+        self.excel = win32.DispatchEx("Excel.Application")
+        self.excel.Visible = False
+        self.excel.DisplayAlerts = False
+
+    def quit(self):
+        import pythoncom
+
+        try:
+            if self.excel is not None:
+                self.excel.Quit()
+        finally:
+            self.excel = None
+            pythoncom.CoUninitialize()
+
+    def embed_zip(self, SaveFile, zippath, row_sn, col_end):
+        # 报告保存时已取消保护并写好下边框，这里只做离线无法完成的插入对象；
+        # 位置由目标单元格算出，不依赖文件中保存的活动单元格
+        wb = self.excel.Workbooks.Open(os.path.abspath(SaveFile))
+        try:
+            ws = wb.Worksheets("Conducted EMI")
+            cell = ws.Cells(row_sn, col_end - 2)
+            ws.OLEObjects().Add(
+                ClassType=None,
+                Filename=os.path.abspath(zippath),
+                Link=False,
+                DisplayAsIcon=True,
+                Left=cell.Left,
+                Top=cell.Top,
+            )
+            wb.Save()
+        finally:
+            wb.Close(SaveChanges=False)
+
+
+class ExcelWorker:
+    """
+    在专用线程中按提交顺序执行 Excel 任务，返回 concurrent.futures.Future
+
+    第一个任务到来时才启动实例，之后一直复用；实例处理 max_jobs 个任务后、
+    任务出错后或提交时 recycle=True 时退出，下一个任务再启动新实例。
+    backend_factory() 返回 ExcelBackend，默认为 ComExcelBackend
+    """
+
+    def __init__(self, backend_factory=ComExcelBackend, max_jobs=MAX_JOBS):
+        self.backend_factory = backend_factory
+        self.max_jobs = max_jobs
+        self.jobs = 0  # 当前实例已完成的任务数
+        self.instances = 0  # 启动过的实例数
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, method, *args, recycle=False):
+        """提交任务: 在工作线程中调用 backend.method(*args)"""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="excel-worker", daemon=True
+                )
+                self._thread.start()
+            self._queue.put((future, method, args, recycle))
+        return future
+
+    def call(self, method, *args, recycle=False):
+        """提交任务并等待结果"""
+        return self.submit(method, *args, recycle=recycle).result()
+
+    def _run(self):
+        backend = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, method, args, recycle = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if backend is None:
+                    backend = self._start()
+                result = getattr(backend, method)(*args)
+            except BaseException as e:
+                logger.error(f"Excel job {method} failed, restarting Excel: {e}")
+                future.set_exception(e)
+                backend = self._recycle(backend)
+                continue
+            future.set_result(result)
+            self.jobs += 1
+            if recycle or self.jobs >= self.max_jobs:
+                backend = self._recycle(backend)
+        self._recycle(backend)
+
+    def _start(self):
+        backend = self.backend_factory()
+        try:
+            backend.start()
+        except BaseException:
+            self._recycle(backend)
+            raise
+        self.jobs = 0
+        self.instances += 1
+        logger.info(f"Excel instance started (#{self.instances})")
+        return backend
+
+    def _recycle(self, backend):
+        if backend is not None:
+            try:
+                backend.quit()
+            except Exception as e:
+                logger.warning(f"Failed to quit Excel: {e}")
+            else:
+                logger.info(f"Excel instance stopped after {self.jobs} jobs")
+        return None
+
+    def shutdown(self, wait=True):
+        """退出实例并结束工作线程，已提交的任务先执行完"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        if wait:
+            thread.join()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def excel_worker():
+    """进程内共享的 ExcelWorker，程序退出时关闭Excel"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ExcelWorker()
+            atexit.register(_worker.shutdown)
+        return _worker
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+各模块共用的文件工具：内容哈希、原子写入、用户缓存目录和默认进程数，不依赖pdf解析和Qt
+"""
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+
+
+def user_cache_dir():
+    """
+    只有当前用户可以写入的缓存目录
+
+    Windows 下为 %LOCALAPPDATA%\\EMIRper，其他系统为 $XDG_CACHE_HOME/EMIRper 或 ~/.cache/EMIRper
+    """
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "EMIRper")
+
+
+def default_workers():
+    """默认进程数（解析、压缩、Word转换）：不超过4个，且不超过CPU核心数"""
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    返回 path 旁的临时文件路径，with 块正常结束后用它替换 path
+
+    同时运行的任务不会看到写了一半的文件；出错时删除临时文件，原文件不变。
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+测试图片的缩放与缓存：JPEG 按接近目标的尺寸解码，缩放结果按图片哈希保存到磁盘
+"""
+import os
+import logging
+from io import BytesIO
+
+from PIL import Image as PImage
+
+from core.fileutil import file_hash, atomic_path
+
+logger = logging.getLogger(__name__)
+
+imageCacheDir = "EMIRper.images"
+IMAGE_HEIGHT = 250  # 报告中图片的高度（像素）
+# 缩放方式变化时增加版本号，旧的缓存自动失效
+IMAGE_CACHE_VERSION = 1
+
+
+def scale_image(img_path, height=IMAGE_HEIGHT):
+    """把图片缩放到指定高度，返回 JPEG 字节"""
+    with PImage.open(img_path) as pimg:
+        # JPEG 在解码时按 1/2、1/4、1/8 缩小到不小于目标的尺寸，
+        # 千万像素的照片不必完整解码
+        pimg.draft("RGB", (pimg.width * height // pimg.height, height))
+        if pimg.mode in ("RGBA", "P"):
+            pimg = pimg.convert("RGB")
+        ratio = height / pimg.height
+        new_size = (int(pimg.width * ratio), int(pimg.height * ratio))
+        # 其他格式先用 reduce 整数倍缩小，再用 LANCZOS 缩放到目标尺寸
+        pimg = pimg.resize(new_size, PImage.Resampling.LANCZOS, reducing_gap=3.0)
+
+        buffer = BytesIO()
+        pimg.save(buffer, format="JPEG", quality=100, optimize=True)
+    return buffer.getvalue()
+
+
+def load_scaled(img_path, height=IMAGE_HEIGHT, cache_dir=None):
+    """
+    返回缩放后的 JPEG 字节
+
+    cache_dir 不为 None 时以 (图片内容哈希, 高度) 为键缓存缩放结果
+    """
+    if cache_dir is None:
+        return scale_image(img_path, height)
+    name = f"{file_hash(img_path)}-{height}-{IMAGE_CACHE_VERSION}.jpg"
+    cache_path = os.path.join(cache_dir, name)
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            logger.debug(f"Image cache hit: {img_path}")
+            return f.read()
+    data = scale_image(img_path, height)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_path(cache_path) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+    except OSError as e:
+        logger.warning(f"Failed to save image cache: {e}")
+    return data
+
+
+def clear_images(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith(".jpg"):
+            os.remove(os.path.join(cache_dir, name))
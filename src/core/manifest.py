@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+模型目录清单：目录只扫描一次，每个pdf只从磁盘读取一次，解析和压缩共用同一份字节
+"""
+import os
+import time
+import logging
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+READ_WORKERS = 4  # 预读线程数，网络共享目录上并发读取更快
+
+
+class ManifestEntry:
+    """一个pdf文件: 绝对路径、包内路径和扫描时的 stat 信息"""
+
+    __slots__ = ("path", "arcname", "size", "mtime", "mtime_ns", "mode")
+
+    def __init__(self, path, arcname, st):
+        self.path = path
+        self.arcname = arcname
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.mode = st.st_mode
+
+    def zipinfo(self):
+        """与 ZipInfo.from_file 相同的文件头，不再访问磁盘"""
+        zinfo = zipfile.ZipInfo(self.arcname, time.localtime(self.mtime)[0:6])
+        zinfo.external_attr = (self.mode & 0xFFFF) << 16
+        zinfo.file_size = self.size
+        return zinfo
+
+
+class Manifest:
+    """
+    directory 下所有pdf的清单
+
+    entries 为目录树中所有pdf，顺序与 os.walk 相同（压缩包的成员顺序）；
+    pdfs 为顶层目录中的pdf文件名，与 list_pdfs 相同（报告的数据来源）。
+    read() 返回文件内容并保存在内存中，同一文件的多个使用者只读取一次；
+    prefetch() 在后台线程中提前读取全部文件。close() 后释放所有内容。
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.realpath(directory)
+        self.entries = []
+        self._scan(self.directory)
+        self.by_name = {entry.arcname: entry for entry in self.entries}
+        self.pdfs = [e.arcname for e in self.entries if os.sep not in e.arcname]
+        self._contents = {}  # 包内路径 -> Future(bytes)
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def _scan(self, folder):
+        subdirs = []
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.is_dir():
+                    # 与 os.walk 相同，不进入符号链接的目录
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif entry.name.endswith(".pdf"):
+                    arcname = os.path.relpath(entry.path, self.directory)
+                    self.entries.append(
+                        ManifestEntry(entry.path, arcname, entry.stat())
+                    )
+        for folder in subdirs:
+            self._scan(folder)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def total_size(self):
+        return sum(entry.size for entry in self.entries)
+
+    def read(self, arcname):
+        """返回文件内容，已读取或正在预读时不再访问磁盘"""
+        with self._lock:
+            future = self._contents.get(arcname)
+            owner = future is None
+            if owner:
+                future = self._contents[arcname] = Future()
+        if owner:
+            try:
+                future.set_result(_read_file(self.by_name[arcname].path))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def prefetch(self, workers=READ_WORKERS):
+        """在后台按清单顺序读取所有文件"""
+        with self._lock:
+            if self._reader is not None:
+                return
+            self._reader = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="manifest-read"
+            )
+            for entry in self.entries:
+                if entry.arcname not in self._contents:
+                    self._contents[entry.arcname] = self._reader.submit(
+                        _read_file, entry.path
+                    )
+        logger.info(
+            f"Prefetching {len(self.entries)} files "
+            f"({self.total_size() / 1e6:.1f} MB) from {self.directory}"
+        )
+
+    def close(self):
+        with self._lock:
+            reader, self._reader = self._reader, None
+            for future in self._contents.values():
+                future.cancel()
+            self._contents.clear()
+        if reader is not None:
+            reader.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+不经过Excel，直接在已保存的xlsx中嵌入文件（OLE包对象，显示为图标）
+
+写入的部件: xl/embeddings/oleObjectN.bin（复合文档，内含 Ole10Native 流）、
+图标图片、vmlDrawing（旧版本Excel显示对象用的形状）以及它们的关系和内容类型。
+只处理 openpyxl 保存的工作簿：工作表和样式使用默认命名空间。
+"""
+import os
+import re
+import uuid
+import struct
+import logging
+import posixpath
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from PIL import Image as PImage, ImageDraw, ImageFont
+
+from core.cfb import write_cfb
+from core.fileutil import atomic_path
+from core.templatemeta import NS, NS_PKG, sheet_paths
+
+logger = logging.getLogger(__name__)
+
+REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+REL_OLE = REL + "/oleObject"
+REL_IMAGE = REL + "/image"
+REL_VML = REL + "/vmlDrawing"
+CT_OLE = "application/vnd.openxmlformats-officedocument.oleObject"
+CT_VML = "application/vnd.openxmlformats-officedocument.vmlDrawing"
+CT_PNG = "image/png"
+
+# OLE Package 对象的类标识 {0003000C-0000-0000-C000-000000000046}
+CLSID_PACKAGE = uuid.UUID("0003000c-0000-0000-c000-000000000046").bytes_le
+ICON_SIZE = (96, 72)  # 图标（含文件名）的像素大小
+EMU_PER_PIXEL = 9525
+
+# 工作表中这些元素必须出现在 legacyDrawing / oleObjects 之后
+LEGACY_DRAWING_NEXT = (
+    "legacyDrawingHF",
+    "drawingHF",
+    "picture",
+    "oleObjects",
+    "controls",
+    "webPublishItems",
+    "tableParts",
+    "extLst",
+)
+OLE_OBJECTS_NEXT = ("controls", "webPublishItems", "tableParts", "extLst")
+
+VML_SHAPETYPE = """<v:shapetype id="_x0000_t75" coordsize="21600,21600" \
+o:spt="75" o:preferrelative="t" path="m@4@5l@4@11@9@11@9@5xe" filled="f" stroked="f">\
+<v:stroke joinstyle="miter"/><v:formulas>\
+<v:f eqn="if lineDrawn pixelLineWidth 0"/><v:f eqn="sum @0 1 0"/>\
+<v:f eqn="sum 0 0 @1"/><v:f eqn="prod @2 1 2"/>\
+<v:f eqn="prod @3 21600 pixelWidth"/><v:f eqn="prod @3 21600 pixelHeight"/>\
+<v:f eqn="sum @0 0 1"/><v:f eqn="prod @6 1 2"/>\
+<v:f eqn="prod @7 21600 pixelWidth"/><v:f eqn="sum @8 21600 0"/>\
+<v:f eqn="prod @7 21600 pixelHeight"/><v:f eqn="sum @10 21600 0"/>\
+</v:formulas><v:path o:extrusionok="f" gradientshapeok="t" o:connecttype="rect"/>\
+<o:lock v:ext="edit" aspectratio="t"/></v:shapetype>"""
+
+
+def ole10native(data, filename):
+    """
+    Ole10Native 流: 包对象的标签、原路径、临时路径和文件内容
+
+    ANSI 字段之后附加 Unicode 版本，非ASCII文件名也能正确显示
+    """
+    ansi = filename.encode("ascii", "replace") + b"\x00"
+    wide = filename.encode("utf-16-le")
+    body = (
+        struct.pack("<H", 2)
+        + ansi  # 标签
+        + ansi  # 原路径
+        + struct.pack("<HH", 0, 3)
+        + struct.pack("<I", len(ansi))
+        + ansi  # 临时路径
+        + struct.pack("<I", len(data))
+        + data
+    )
+    for _ in range(3):  # 临时路径、标签、原路径的 Unicode 版本
+        body += struct.pack("<I", len(filename)) + wide
+    return struct.pack("<I", len(body)) + body
+
+
+def comp_obj():
+    """CompObj 流: 对象的显示类型和 ProgID"""
+
+    def ansi(text):
+        text = text.encode("ascii") + b"\x00"
+        return struct.pack("<I", len(text)) + text
+
+    return (
+        struct.pack("<HHIi", 1, 0xFFFE, 0x0A03, -1)
+        + CLSID_PACKAGE
+        + ansi("OLE Package")
+        + struct.pack("<I", 0)  # 无剪贴板格式
+        + ansi("Package")
+        + struct.pack("<I", 0x71B239F4)  # Unicode 部分的标记
+        + struct.pack("<III", 0, 0, 0)
+    )
+
+
+def ole_package(data, filename):
+    """把文件打包为 OLE Package 对象（复合文档字节）"""
+    return write_cfb(
+        [
+            ("\x01Ole10Native", ole10native(data, filename)),
+            ("\x01CompObj", comp_obj()),
+            ("\x03ObjInfo", b"\x00\x00\x03\x00\x0d\x00"),
+        ],
+        CLSID_PACKAGE,
+    )
+
+
+def icon_image(filename, size=ICON_SIZE):
+    """绘制压缩包图标和文件名，返回PNG字节"""
+    width, height = size
+    img = PImage.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    # 32x32 的文件图标，中间一列拉链
+    x0, y0 = (width - 32) // 2, 4
+    draw.rectangle([x0, y0, x0 + 31, y0 + 31], fill="#f3c94c", outline="#8a6d1c")
+    for y in range(y0 + 2, y0 + 22, 4):
+        draw.rectangle([x0 + 13, y, x0 + 18, y + 1], fill="#5a4710")
+    draw.rectangle([x0 + 12, y0 + 22, x0 + 19, y0 + 28], outline="#5a4710")
+
+    font = ImageFont.load_default()
+    label = filename
+    while len(label) > 4 and draw.textlength(label, font=font) > width - 4:
+        label = label[:-4] + "..."
+    text_width = draw.textlength(label, font=font)
+    draw.text(((width - text_width) / 2, y0 + 38), label, fill="black", font=font)
+
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def column_letter(col):
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def column_pixels(width):
+    """列宽（字符数）换算为像素，按默认字体最大数字宽度7像素"""
+    return int(((256 * width + int(128 / 7)) / 256) * 7)
+
+
+class SheetGeometry:
+    """从工作表XML读取列宽和行高，用于计算对象的锚点"""
+
+    def __init__(self, root):
+        fmt = root.find(f"{NS}sheetFormatPr")
+        fmt = {} if fmt is None else fmt.attrib
+        if "defaultColWidth" in fmt:
+            self.default_width = column_pixels(float(fmt["defaultColWidth"]))
+        else:
+            self.default_width = column_pixels(float(fmt.get("baseColWidth", 8))) + 5
+        self.default_height = float(fmt.get("defaultRowHeight", 15)) * 96 / 72
+        self.widths = {}
+        for col in root.iter(f"{NS}col"):
+            if col.get("width") is None:
+                continue
+            pixels = (
+                0
+                if col.get("hidden") == "1"
+                else column_pixels(float(col.get("width")))
+            )
+            for i in range(int(col.get("min")), int(col.get("max")) + 1):
+                self.widths[i] = pixels
+        self.heights = {}
+        for row in root.iter(f"{NS}row"):
+            if row.get("hidden") == "1":
+                self.heights[int(row.get("r"))] = 0
+            elif row.get("ht") is not None:
+                self.heights[int(row.get("r"))] = float(row.get("ht")) * 96 / 72
+
+    def width(self, col):
+        return self.widths.get(col, self.default_width)
+
+    def height(self, row):
+        return self.heights.get(row, self.default_height)
+
+    def span(self, start, pixels, size):
+        """从 start 开始占用 pixels 像素，返回 (结束的行或列, 在其中的偏移像素)"""
+        i = start
+        while pixels > size(i):
+            pixels -= size(i)
+            i += 1
+        return i, int(pixels)
+
+    def anchor(self, row, col, size):
+        """对象左上角在 (row, col) 单元格时的 (起始列, 起始行, 结束列, 列偏移, 结束行, 行偏移)"""
+        end_col, col_off = self.span(col, size[0], self.width)
+        end_row, row_off = self.span(row, size[1], self.height)
+        return col, row, end_col, col_off, end_row, row_off
+
+    def offset(self, row, col):
+        """单元格左上角相对于工作表左上角的位置（磅）"""
+        left = sum(self.width(i) for i in range(1, col))
+        top = sum(self.height(i) for i in range(1, row))
+        return left * 0.75, top * 0.75
+
+
+class XlsxPackage:
+    """xlsx 压缩包中的部件，修改后整体写回"""
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            self.names = zf.namelist()
+            self.parts = {name: zf.read(name) for name in self.names}
+
+    def read(self, name):
+        return self.parts[name]
+
+    def write(self, name, data):
+        if name not in self.parts:
+            self.names.append(name)
+        self.parts[name] = data.encode("utf-8") if isinstance(data, str) else data
+
+    def unused_name(self, pattern):
+        i = 1
+        while pattern.format(i) in self.parts:
+            i += 1
+        return pattern.format(i)
+
+    @staticmethod
+    def rels_path(part):
+        folder, name = posixpath.split(part)
+        return posixpath.join(folder, "_rels", name + ".rels")
+
+    def relationships(self, part):
+        """部件的关系: {Id: (Type, 目标部件路径)}"""
+        rels_path = self.rels_path(part)
+        if rels_path not in self.parts:
+            return {}
+        rels = {}
+        for rel in ET.fromstring(self.parts[rels_path]).iter(f"{NS_PKG}Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(
+                    posixpath.join(posixpath.dirname(part), target)
+                )
+            rels[rel.get("Id")] = (rel.get("Type"), target)
+        return rels
+
+    def add_relationship(self, part, rel_type, target):
+        """添加一个关系，target 为目标部件路径，返回新的 Id"""
+        rels_path = self.rels_path(part)
+        existing = self.relationships(part)
+        i = len(existing) + 1
+        while f"rId{i}" in existing:
+            i += 1
+        rid = f"rId{i}"
+        relative = posixpath.relpath(target, posixpath.dirname(part))
+        rel = (
+            f"<Relationship Id={quoteattr(rid)} Type={quoteattr(rel_type)} "
+            f"Target={quoteattr(relative)}/>"
+        )
+        if rels_path in self.parts:
+            xml = self.parts[rels_path].decode("utf-8")
+            i = xml.rindex("</Relationships>")
+            xml = xml[:i] + rel + xml[i:]
+        else:
+            xml = (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<Relationships xmlns="{NS_PKG[1:-1]}">{rel}</Relationships>'
+            )
+        self.write(rels_path, xml)
+        return rid
+
+    def add_default(self, extension, content_type):
+        """在 [Content_Types].xml 中登记扩展名的默认内容类型"""
+        xml = self.parts["[Content_Types].xml"].decode("utf-8")
+        if re.search(rf'<Default[^>]*Extension="{extension}"', xml, re.I):
+            return
+        i = xml.index(">", xml.index("<Types")) + 1
+        default = f'<Default Extension="{extension}" ContentType="{content_type}"/>'
+        self.write("[Content_Types].xml", xml[:i] + default + xml[i:])
+
+    def save(self, path=None):
+        path = path or self.path
+        with atomic_path(path) as tmp_path:
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+                for name in self.names:
+                    zf.writestr(name, self.parts[name])
+
+
+def insert_before(xml, fragment, next_tags, end_tag):
+    """把 fragment 插入到 next_tags 中第一个出现的元素之前，都没有时插入到 end_tag 之前"""
+    positions = [
+        m.start()
+        for m in (re.search(rf"<{tag}[\s/>]", xml) for tag in next_tags)
+        if m is not None
+    ]
+    i = min(positions) if positions else xml.rindex(end_tag)
+    return xml[:i] + fragment + xml[i:]
+
+
+def shape_ids(package):
+    """所有 vmlDrawing 使用的 (idmap 区块, 形状编号)"""
+    blocks, ids = set(), set()
+    for name, data in package.parts.items():
+        if name.endswith(".vml"):
+            text = data.decode("utf-8", "replace")
+            for m in re.finditer(r'<o:idmap[^>]*data="([\d,]+)"', text):
+                blocks.update(int(b) for b in m.group(1).split(","))
+            ids.update(int(i) for i in re.findall(r"_x0000_s(\d+)", text))
+    return blocks, ids
+
+
+def vml_shape(shape_id, rid, anchor, offset, size):
+    col, row, end_col, col_off, end_row, row_off = anchor
+    left, top = offset
+    # x:Anchor 为从0开始的 列, 偏移, 行, 偏移, 列, 偏移, 行, 偏移（像素）
+    return (
+        f'<v:shape id="_x0000_s{shape_id}" type="#_x0000_t75" '
+        f'style="position:absolute;margin-left:{left:g}pt;margin-top:{top:g}pt;'
+        f'width:{size[0] * 0.75:g}pt;height:{size[1] * 0.75:g}pt;z-index:1">'
+        f'<v:imagedata o:relid="{rid}" o:title=""/>'
+        '<x:ClientData ObjectType="Pict"><x:SizeWithCells/>'
+        f"<x:Anchor>{col - 1}, 0, {row - 1}, 0, {end_col - 1}, {col_off}, "
+        f"{end_row - 1}, {row_off}</x:Anchor>"
+        "<x:CF>Pict</x:CF><x:AutoPict/></x:ClientData></v:shape>"
+    )
+
+
+def ole_object(shape_id, ole_rid, image_rid, anchor):
+    col, row, end_col, col_off, end_row, row_off = anchor
+    legacy = (
+        f'<oleObject progId="Package" dvAspect="DVASPECT_ICON" '
+        f'shapeId="{shape_id}" r:id="{ole_rid}"'
+    )
+    return (
+        '<mc:AlternateContent xmlns:mc="http://schemas.openxmlformats.org/'
+        'markup-compatibility/2006" xmlns:x14="http://schemas.microsoft.com/'
+        'office/spreadsheetml/2009/9/main" xmlns:xdr="http://schemas.openxmlformats.org/'
+        f'drawingml/2006/spreadsheetDrawing" xmlns:r="{REL}">'
+        f'<mc:Choice Requires="x14">{legacy}>'
+        f'<objectPr defaultSize="0" autoPict="0" r:id="{image_rid}">'
+        '<anchor moveWithCells="1">'
+        f"<from><xdr:col>{col - 1}</xdr:col><xdr:colOff>0</xdr:colOff>"
+        f"<xdr:row>{row - 1}</xdr:row><xdr:rowOff>0</xdr:rowOff></from>"
+        f"<to><xdr:col>{end_col - 1}</xdr:col>"
+        f"<xdr:colOff>{col_off * EMU_PER_PIXEL}</xdr:colOff>"
+        f"<xdr:row>{end_row - 1}</xdr:row>"
+        f"<xdr:rowOff>{row_off * EMU_PER_PIXEL}</xdr:rowOff></to>"
+        "</anchor></objectPr></oleObject></mc:Choice>"
+        f"<mc:Fallback>{legacy}/></mc:Fallback></mc:AlternateContent>"
+    )
+
+
+def add_ole_object(package, sheet_part, data, filename, row, col):
+    """在工作表 sheet_part 的 (row, col) 单元格处嵌入文件，显示为图标"""
+    xml = package.read(sheet_part).decode("utf-8")
+    geometry = SheetGeometry(ET.fromstring(xml))
+    anchor = geometry.anchor(row, col, ICON_SIZE)
+
+    ole_part = package.unused_name("xl/embeddings/oleObject{}.bin")
+    package.write(ole_part, ole_package(data, filename))
+    image_part = package.unused_name("xl/media/image{}.png")
+    package.write(image_part, icon_image(filename))
+    package.add_default("bin", CT_OLE)
+    package.add_default("png", CT_PNG)
+    package.add_default("vml", CT_VML)
+    ole_rid = package.add_relationship(sheet_part, REL_OLE, ole_part)
+    image_rid = package.add_relationship(sheet_part, REL_IMAGE, image_part)
+
+    # 旧版本Excel通过 vmlDrawing 中的形状显示对象；工作表已有 vmlDrawing 时追加形状
+    blocks, ids = shape_ids(package)
+    rels = package.relationships(sheet_part)
+    legacy = re.search(r'<legacyDrawing[^>]*r:id="([^"]+)"', xml)
+    if legacy is not None:
+        vml_part = rels[legacy.group(1)][1]
+        vml = package.read(vml_part).decode("utf-8")
+        block = re.search(r'<o:idmap[^>]*data="(\d+)', vml)
+        block = int(block.group(1)) if block else max(blocks, default=0) + 1
+    else:
+        vml_part = package.unused_name("xl/drawings/vmlDrawing{}.vml")
+        block = max(blocks, default=0) + 1
+        vml = (
+            '<xml xmlns:v="urn:schemas-microsoft-com:vml" '
+            'xmlns:o="urn:schemas-microsoft-com:office:office" '
+            'xmlns:x="urn:schemas-microsoft-com:office:excel">'
+            '<o:shapelayout v:ext="edit">'
+            f'<o:idmap v:ext="edit" data="{block}"/></o:shapelayout></xml>'
+        )
+        vml_rid = package.add_relationship(sheet_part, REL_VML, vml_part)
+        xml = insert_before(
+            xml,
+            f'<legacyDrawing xmlns:r="{REL}" r:id="{vml_rid}"/>',
+            LEGACY_DRAWING_NEXT,
+            "</worksheet>",
+        )
+    shape_id = max([i for i in ids if i // 1024 == block], default=block * 1024) + 1
+    vml_image_rid = package.add_relationship(vml_part, REL_IMAGE, image_part)
+    shape = vml_shape(
+        shape_id, vml_image_rid, anchor, geometry.offset(row, col), ICON_SIZE
+    )
+    if "_x0000_t75" not in vml:
+        shape = VML_SHAPETYPE + shape
+    i = vml.rindex("</xml>")
+    package.write(vml_part, vml[:i] + shape + vml[i:])
+
+    obj = ole_object(shape_id, ole_rid, image_rid, anchor)
+    if "</oleObjects>" in xml:
+        i = xml.index("</oleObjects>")
+        xml = xml[:i] + obj + xml[i:]
+    else:
+        xml = insert_before(
+            xml, f"<oleObjects>{obj}</oleObjects>", OLE_OBJECTS_NEXT, "</worksheet>"
+        )
+    package.write(sheet_part, xml)
+
+
+def embed_file(xlsx_path, file_path, sheet, row, col):
+    """
+    把 file_path 作为OLE包对象嵌入 xlsx_path 的 sheet 工作表，左上角在 (row, col)
+
+    在已保存的文件上原地修改（先写临时文件再替换），不需要Excel
+    """
+    package = XlsxPackage(xlsx_path)
+    sheet_part = sheet_paths(package)[sheet]
+    with open(file_path, "rb") as f:
+        data = f.read()
+    add_ole_object(package, sheet_part, data, os.path.basename(file_path), row, col)
+    package.save()
+    logger.info(f"Embedded {os.path.basename(file_path)} into {xlsx_path}")
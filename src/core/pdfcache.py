@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+pdf解析结果的本地缓存（SQLite），避免重复解析未改动的报告
+"""
+import os
+import json
+import sqlite3
+import logging
+
+from core.fileutil import file_hash, content_hash
+from core.pdfparse import PARSER_VERSION
+
+logger = logging.getLogger(__name__)
+
+cacheName = "EMIRper.cache.db"
+
+
+class PdfCache:
+    """
+    以 (路径, 大小, 修改时间, 内容哈希) 为键保存 open_pdf 的返回结果
+
+    大小和修改时间一致时直接命中；不一致时再比较内容哈希，
+    因此复制或touch过的文件也不会被重复解析。
+    解析器版本号变化时整个缓存自动失效。
+    """
+
+    def __init__(self, db_path, parser_version=PARSER_VERSION):
+        self.db_path = db_path
+        self.parser_version = parser_version
+        self._keys = {}  # get() 未命中时计算的键，供 put() 复用，见 discard
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, "
+            "sha256 TEXT, data TEXT)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_reports_sha256 ON reports (sha256)"
+        )
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'parser_version'"
+        ).fetchone()
+        if row is None or row[0] != str(parser_version):
+            if row is not None:
+                logger.info(
+                    f"Parser version changed ({row[0]} -> {parser_version}), "
+                    "cache invalidated."
+                )
+            self.clear()
+        self.conn.commit()
+
+    def get(self, path, read=None):
+        """
+        命中返回缓存的结果字典，否则返回 None
+
+        read() 返回已读入内存的文件内容时用它计算哈希，不再读取磁盘
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime, sha256, data FROM reports WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return json.loads(row[3])
+
+        sha256 = file_hash(path) if read is None else content_hash(read())
+        key = (st.st_size, st.st_mtime_ns, sha256)
+        if row and row[2] == sha256:
+            data = row[3]
+        else:
+            row = self.conn.execute(
+                "SELECT data FROM reports WHERE sha256 = ? LIMIT 1", (sha256,)
+            ).fetchone()
+            if row is None:
+                # 未命中的文件解析后 put() 不必再计算哈希
+                self._keys[path] = key
+                return None
+            data = row[0]
+        self._store(path, key, data)
+        return json.loads(data)
+
+    def put(self, path, result, read=None):
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        key = self._keys.pop(path, None)
+        if key is None or key[:2] != (st.st_size, st.st_mtime_ns):
+            # 没有经过 get()，或文件在 get() 之后又被修改
+            sha256 = file_hash(path) if read is None else content_hash(read())
+            key = (st.st_size, st.st_mtime_ns, sha256)
+        self._store(path, key, json.dumps(result, ensure_ascii=False))
+
+    def discard(self, path):
+        """丢弃 get() 未命中时记下的键；解析失败、不会再 put() 的文件需要调用"""
+        self._keys.pop(os.path.realpath(path), None)
+
+    def _store(self, path, key, data):
+        size, mtime, sha256 = key
+        self.conn.execute(
+            "INSERT OR REPLACE INTO reports (path, size, mtime, sha256, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (path, size, mtime, sha256, data),
+        )
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM reports")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('parser_version', ?)",
+            (str(self.parser_version),),
+        )
+        self.conn.commit()
+        logger.info("Pdf cache cleared.")
+
+    def close(self):
+        self._keys.clear()
+        self.conn.close()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+ELEKTRA pdf报告解析，不依赖Qt，可以在子进程中运行
+"""
+import os
+import sys
+import time
+import logging
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pdfplumber
+from pdfplumber.page import PDFPageAggregatorWithMarkedContent
+from pdfplumber.utils import extract_text
+from pdfminer.pdfinterp import PDFPageInterpreter
+
+logger = logging.getLogger(__name__)
+
+# 解析结果格式或解析逻辑变化时加1，用于使缓存失效
+PARSER_VERSION = 2
+
+# ELEKTRA 4.52 报告中需要读取的区域: (页码, (x0, top, x1, bottom))，按页面宽高的比例
+# 第1页上方为表头信息，下方为曲线图；第2页 "Final Result" 标题下为最终结果表，
+# 结果表区域去掉页眉和 "Page 2 of 2" 页脚
+ELEKTRA_452_REGIONS = {
+    "header": (0, (0.0, 0.0, 1.0, 0.4)),
+    "table": (1, (0.0, 0.05, 1.0, 0.93)),
+}
+HEADER_KEYS = ("Serial", "Power", "Load")
+
+# 结果表中参与比较的列: 名称 -> 列号
+MARGIN_COLUMNS = {"pk": 4, "avg": 7}
+MARGIN_DTYPE = np.dtype([(name, np.float64) for name in MARGIN_COLUMNS])
+
+
+class LayoutMismatch(Exception):
+    """pdf版面与 ELEKTRA 4.52 不符，需要回退到整页提取"""
+
+
+class TextOnlyAggregator(PDFPageAggregatorWithMarkedContent):
+    # 曲线图由上千条线段组成，区域提取只需要字符，跳过线条和图片对象
+    def paint_path(self, *args, **kwargs):
+        pass
+
+    def render_image(self, *args, **kwargs):
+        pass
+
+
+def list_pdfs(modeldir):
+    return [f for f in os.listdir(modeldir) if f.endswith(".pdf")]
+
+
+def open_pdf(path_pdf, engine="auto", top_k=None, data=None):
+    """
+    读取pdf文件，提取数据
+
+    engine="auto" 时只读取表头和结果表区域的字符，版面不符时回退到整页提取；
+    engine="text" 时总是整页提取。
+    top_k 为结果表中保留的裕量最小的行数，None 表示保留整张表；
+    data 为已读入内存的文件内容，不为 None 时不再读取 path_pdf
+    """
+    with pdfplumber.open(path_pdf if data is None else BytesIO(data)) as pdf:
+        if engine == "auto":
+            try:
+                return extract_regions(pdf, top_k=top_k)
+            except LayoutMismatch as e:
+                logger.info(f"Fallback to full text extraction {path_pdf}: {e}")
+            except Exception as e:
+                # 区域提取用到 pdfplumber 的内部接口，版本变化时同样回退到整页提取
+                logger.warning(
+                    f"Region extraction failed {path_pdf}, "
+                    f"fallback to full text extraction: {type(e).__name__}: {e}"
+                )
+        text = pdf.pages[0].extract_text() + "\n" + pdf.pages[1].extract_text()
+        datas = [item for item in text.split("\n") if item]
+        return deal_datas(datas, top_k)
+
+
+def load_text_layout(page):
+    """只解析页面中的字符，替代 page.layout 的完整解析"""
+    if hasattr(page, "_layout"):
+        return
+    device = TextOnlyAggregator(
+        page.pdf.rsrcmgr, pageno=page.page_number, laparams=page.pdf.laparams
+    )
+    PDFPageInterpreter(page.pdf.rsrcmgr, device).process_page(page.page_obj)
+    page._layout = device.get_result()
+
+
+def region_lines(page, region):
+    # 只对区域内的字符做分词和行聚类
+    load_text_layout(page)
+    x0, top, x1, bottom = region
+    x0, x1 = x0 * page.width, x1 * page.width
+    top, bottom = top * page.height, bottom * page.height
+    chars = [
+        c
+        for c in page.chars
+        if c["x0"] >= x0 and c["x1"] <= x1 and c["top"] >= top and c["bottom"] <= bottom
+    ]
+    return [item for item in extract_text(chars).split("\n") if item]
+
+
+def extract_regions(pdf, regions=ELEKTRA_452_REGIONS, top_k=None):
+    if len(pdf.pages) < 2:
+        raise LayoutMismatch("less than 2 pages")
+    page_no, region = regions["header"]
+    header = region_lines(pdf.pages[page_no], region)
+    found = {line.split(" ")[0] for line in header}
+    missing = [key for key in HEADER_KEYS if key not in found]
+    if missing:
+        raise LayoutMismatch(f"header keys not found: {missing}")
+
+    page_no, region = regions["table"]
+    table = [
+        line
+        for line in region_lines(pdf.pages[page_no], region)
+        if len(line.split(" ")) > 10
+    ]
+    try:
+        return deal_lines(header, table, top_k)
+    except (IndexError, ValueError) as e:
+        raise LayoutMismatch(f"result table not found: {e}")
+
+
+def deal_datas(datas, top_k=None):
+    # 表头在前20行内，结果表在第15行之后
+    return deal_lines(datas[:20], datas[15:], top_k)
+
+
+def deal_lines(header_lines, table_lines, top_k=None):
+    res = {}
+    for data in header_lines:
+        tmp = data.split(" ")
+        if tmp[0] == "Serial":
+            res["Serial"] = tmp[-1]
+        elif tmp[0] == "Power":
+            res["Power"] = tmp[-1]
+        elif tmp[0] == "Load":
+            res["Load"] = tmp[-1]
+    resdatas = []
+    for it in table_lines:
+        data = it.split(" ")
+        if len(data) > 10:
+            resdatas.append(data)
+    for i in range(len(resdatas)):
+        resdatas[i][0] = str(i + 1)
+    table = margin_table(resdatas)
+    # 取avg和pk中最小的
+    i_avg, i_pk = table["avg"].argmin(), table["pk"].argmin()
+    column = "avg" if table["avg"][i_avg] <= table["pk"][i_pk] else "pk"
+    res["datas"] = [resdatas[i] for i in smallest(table[column], top_k)]
+    return res
+
+
+def margin_table(rows):
+    """把结果表的裕量列一次性转换为 float 结构化数组"""
+    table = np.empty(len(rows), dtype=MARGIN_DTYPE)
+    for name, col in MARGIN_COLUMNS.items():
+        table[name] = [row[col] for row in rows]
+    return table
+
+
+def smallest(values, top_k=None):
+    """
+    返回最小的 top_k 个值的下标（升序，值相同时保持原顺序）
+
+    top_k 为 None 时返回全部下标，等同于对整列排序
+    """
+    if top_k is None or top_k >= len(values):
+        return np.argsort(values, kind="stable")
+    idx = np.sort(np.argpartition(values, top_k - 1)[:top_k])
+    return idx[np.argsort(values[idx], kind="stable")]
+
+
+def iter_parse(
+    modeldir,
+    source_files,
+    workers=1,
+    engine="auto",
+    top_k=None,
+    pool=None,
+    read=None,
+):
+    """
+    逐个解析pdf文件，按完成顺序产出 (文件名, 结果, 异常)
+
+    workers > 1 时使用进程池并行解析（pdfplumber 受GIL限制，线程无法加速）；
+    传入 pool 时使用外部共享的进程池，workers 不再起作用；
+    read(文件名) 返回文件内容时从内存解析（见 Manifest.read），不再读取磁盘
+    """
+    if pool is None and (workers <= 1 or len(source_files) <= 1):
+        for source_file in source_files:
+            try:
+                path_pdf = os.path.join(modeldir, source_file)
+                data = read(source_file) if read is not None else None
+                yield source_file, open_pdf(path_pdf, engine, top_k, data), None
+            except Exception as e:
+                yield source_file, None, e
+        return
+
+    if pool is not None:
+        yield from _iter_pool(pool, modeldir, source_files, engine, top_k, read)
+        return
+    workers = min(workers, len(source_files))
+    logger.info(f"Parsing {len(source_files)} pdf files with {workers} processes")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from _iter_pool(pool, modeldir, source_files, engine, top_k, read)
+
+
+def _iter_pool(pool, modeldir, source_files, engine, top_k, read=None):
+    futures = {}
+    for f in source_files:
+        data = None
+        if read is not None:
+            try:
+                data = read(f)
+            except OSError:
+                pass  # 交给 open_pdf 读取，报告同样的错误
+        path_pdf = os.path.join(modeldir, f)
+        futures[pool.submit(open_pdf, path_pdf, engine, top_k, data)] = f
+    try:
+        for future in as_completed(futures):
+            source_file = futures[future]
+            try:
+                yield source_file, future.result(), None
+            except Exception as e:
+                yield source_file, None, e
+    finally:
+        # 提前结束时（如写入出错）取消尚未开始的解析任务
+        for future in futures:
+            future.cancel()
+
+
+def compare_engines(modeldir):
+    """对同一批文件比较区域提取与整页提取的耗时和结果"""
+    totals = {"auto": 0.0, "text": 0.0}
+    mismatches = []
+    for source_file in list_pdfs(modeldir):
+        path_pdf = os.path.join(modeldir, source_file)
+        results = {}
+        for engine in totals:
+            start = time.perf_counter()
+            results[engine] = open_pdf(path_pdf, engine)
+            totals[engine] += time.perf_counter() - start
+        if results["auto"] != results["text"]:
+            mismatches.append(source_file)
+    return totals, mismatches
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m core.pdfparse <model_dir>")
+        sys.exit(1)
+    totals, mismatches = compare_engines(sys.argv[1])
+    count = len(list_pdfs(sys.argv[1]))
+    for engine, total in totals.items():
+        print(
+            f"{engine:>5}: {total:.3f}s total, {total / max(count, 1) * 1000:.1f}ms/file"
+        )
+    print(f"speedup: {totals['text'] / max(totals['auto'], 1e-9):.2f}x")
+    print(f"mismatches: {len(mismatches)} {mismatches}")
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+模型目录的解析流程：先查缓存，再解析未命中的文件，不依赖Qt
+"""
+import os
+import logging
+from functools import partial
+
+from core.pdfparse import iter_parse
+from core.pdfcache import PdfCache
+
+logger = logging.getLogger(__name__)
+
+
+def parse_dir(
+    modeldir,
+    source_files,
+    workers=1,
+    cache_path=None,
+    pool=None,
+    manifest=None,
+    top_k=None,
+    known=None,
+):
+    """
+    按完成顺序产出 (文件名, 结果, 异常)
+
+    cache_path 不为 None 时先从缓存中读取，只解析未命中的文件并写回缓存；
+    pool 为多个目录共享的进程池，见 iter_parse；
+    manifest 为 modeldir 的 Manifest，哈希和解析都使用其中读入的内容；
+    top_k 为每个文件保留的裕量最小的行数，见 open_pdf。缓存中总是保存整张表，
+    使用缓存时解析整张表后再截取，不使用缓存时由解析器直接只选出 top_k 行；
+    known 为已有的 {文件名: 结果}（如监视模式解析的结果），其中的文件直接产出
+    """
+    parse_top_k = None if cache_path else top_k
+    read = manifest.read if manifest is not None else None
+    # sqlite连接只能在创建它的线程中使用，因此在生成器内打开
+    cache = PdfCache(cache_path) if cache_path else None
+    try:
+        misses = []
+        for source_file in source_files:
+            data = known.get(source_file) if known else None
+            if data is None and cache is not None:
+                try:
+                    data = cache.get(
+                        os.path.join(modeldir, source_file),
+                        read and partial(read, source_file),
+                    )
+                except Exception as e:
+                    logger.warning(f"Pdf cache lookup failed {source_file}: {e}")
+            if data is None:
+                misses.append(source_file)
+                continue
+            yield source_file, first_rows(data, top_k), None
+        if cache is not None:
+            logger.info(
+                f"Pdf cache: {len(source_files) - len(misses)} hit, {len(misses)} miss"
+            )
+
+        for source_file, data, err in iter_parse(
+            modeldir, misses, workers=workers, top_k=parse_top_k, pool=pool, read=read
+        ):
+            logger.info(f"Deal pdf fileName: {source_file}")
+            if err is None and cache is not None:
+                try:
+                    cache.put(
+                        os.path.join(modeldir, source_file),
+                        data,
+                        read and partial(read, source_file),
+                    )
+                except Exception as e:
+                    # 缓存写入失败（如其他进程锁住数据库）不影响本次结果
+                    logger.warning(f"Pdf cache store failed {source_file}: {e}")
+            elif cache is not None:
+                # 解析失败的文件不会写入缓存，释放 get() 时记下的键
+                cache.discard(os.path.join(modeldir, source_file))
+            yield source_file, first_rows(data, top_k), err
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def first_rows(data, top_k=None):
+    """只保留结果表中裕量最小的 top_k 行（结果表已按裕量升序排列）"""
+    if data is None or top_k is None:
+        return data
+    return dict(data, datas=data["datas"][:top_k])
+
+
+class InOrder:
+    """
+    把按完成顺序到达的结果整理为目录顺序
+
+    并行解析的完成顺序不固定，按目录顺序写入才能保证序列号的写入位置不变
+    """
+
+    def __init__(self, source_files):
+        self.source_files = source_files
+        self.arrived = {}
+        self.next = 0
+
+    def push(self, source_file, data, err=None):
+        """加入一个结果，返回现在可以按顺序处理的 (文件名, 结果, 异常) 列表"""
+        self.arrived[source_file] = (data, err)
+        ready = []
+        while (
+            self.next < len(self.source_files)
+            and self.source_files[self.next] in self.arrived
+        ):
+            name = self.source_files[self.next]
+            ready.append((name,) + self.arrived.pop(name))
+            self.next += 1
+        return ready
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+只根据文件名规划报告的行布局，在解析pdf之前发现命名问题，不依赖Qt
+
+文件命名规则见 使用须知.md: 序列号-输入电压-负载-线性.pdf，如 SN001-110V-25%-L.pdf
+结果总是按pdf内容写入，文件名的问题只作为警告；只有模板放不下时才不能生成报告。
+"""
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+line_names = {"L": "Line", "L1": "Line", "N": "Neutral"}
+
+
+def split_name(source_file):
+    """把文件名拆分为 (序列号, 电压, 负载%, 线性)，不符合命名规则时返回 None"""
+    parts = os.path.splitext(source_file)[0].split("-")
+    if len(parts) < 4:
+        return None
+    voltage = re.match(r"\d+", parts[1])
+    load = re.match(r"\d+", parts[2])
+    line = line_names.get(parts[3].upper())
+    if not parts[0] or voltage is None or load is None or line is None:
+        return None
+    return parts[0], int(voltage.group()), int(load.group()), line
+
+
+class TemplateLayout:
+    """模板中第一个单体区块的电压、负载和线性排布"""
+
+    def __init__(self, row_sn, loadqty, voltages, loads, blocks):
+        self.row_sn = row_sn
+        self.loadqty = loadqty
+        self.voltages = voltages  # 上下两半区块的电压
+        self.loads = loads  # 每个电压下的负载%，按行顺序
+        self.blocks = blocks  # 模板中的单体区块数量
+
+    @classmethod
+    def from_sheet(cls, ws, row_sn, col_vol, col_load, loadqty):
+        voltages = [
+            ws.cell(row=row_sn, column=col_vol).value,
+            ws.cell(row=row_sn + loadqty * 2, column=col_vol).value,
+        ]
+        loads = []
+        for i in range(loadqty):
+            value = ws.cell(row=row_sn + i * 2, column=col_load).value
+            loads.append(
+                round(value * 100) if isinstance(value, (int, float)) else None
+            )
+        # 每个区块的第一行都填有电压
+        blocks = 0
+        while ws.cell(row=row_sn + blocks * loadqty * 4, column=col_vol).value:
+            blocks += 1
+        return cls(row_sn, loadqty, voltages, loads, blocks)
+
+
+class Plan:
+    """
+    报告的行布局: 单体数量、需要删除的行、每个文件写入的行
+
+    plan_files 只需要文件名；resolve 读入模板布局后才能确定单体数量是否超出模板、
+    需要删除的行和每个文件的行号。
+    warnings 为文件名的问题（不符合命名规则、模板中没有的电压或负载、重复的行），
+    这些文件仍按解析出的序列号、电压、负载和线性写入；
+    conflicts 为模板放不下的问题，非空时不应继续生成报告。
+    """
+
+    def __init__(self, source_files):
+        self.source_files = source_files
+        self.names = {}  # 文件名 -> (序列号, 电压, 负载%, 线性)
+        self.serials = []  # 按目录顺序出现的序列号，下标即区块序号
+        self.unplanned = []  # 不符合命名规则的文件，单体数量要解析后才知道
+        self.rows = {}  # 文件名 -> 写入的行
+        self.warnings = []
+        self.conflicts = []
+        self.blocks = None  # 报告中保留的单体区块数量
+        self.delete_start = None
+        self.delete_count = None
+
+    @property
+    def test_count(self):
+        return len(self.serials)
+
+    @property
+    def complete(self):
+        """所有文件都能从文件名规划时为 True，此时单体数量在解析前即可确定"""
+        return not self.unplanned
+
+    def resolve(self, layout):
+        """根据模板布局计算需要删除的行和每个文件的目标行"""
+        loadqty = layout.loadqty
+        if self.test_count > layout.blocks:
+            self.conflicts.append(
+                f"Number of Load is too many! {self.test_count} > {layout.blocks}"
+            )
+            return self
+        # 有无法规划的文件时先保留所有区块，写完后再删去没有用到的区块
+        self.blocks = self.test_count if self.complete else layout.blocks
+        self.delete_start = layout.row_sn + loadqty * 4 * self.blocks
+        self.delete_count = loadqty * 4 * (layout.blocks - self.blocks)
+        targets = {}
+        for source_file, (serial, voltage, load, line) in self.names.items():
+            if voltage not in layout.voltages:
+                self.warnings.append(
+                    f"{source_file}: 模板中没有 {voltage}V (模板: {layout.voltages})"
+                )
+                continue
+            if load not in layout.loads:
+                self.warnings.append(
+                    f"{source_file}: 模板中没有 {load}% 负载 (模板: {layout.loads})"
+                )
+                continue
+            row = (
+                layout.row_sn
+                + self.serials.index(serial) * loadqty * 4
+                + layout.voltages.index(voltage) * loadqty * 2
+                + layout.loads.index(load) * 2
+                + (0 if line == "Line" else 1)
+            )
+            if row in targets:
+                self.warnings.append(
+                    f"{source_file}: 与 {targets[row]} 写入同一行 {row}"
+                )
+                continue
+            targets[row] = source_file
+            self.rows[source_file] = row
+        return self
+
+    def check(self, source_file, datas):
+        """比较解析结果与文件名，返回不一致的项"""
+        name = self.names.get(source_file)
+        if name is None:
+            return []
+        serial, voltage, load, line = name
+        problems = []
+        if datas.get("Serial") != serial:
+            problems.append(f"序列号 {datas.get('Serial')} != {serial}")
+        power = re.match(r"\d+", datas.get("Power", ""))
+        if power is None or int(power.group()) != voltage:
+            problems.append(f"电压 {datas.get('Power')} != {voltage}V")
+        pdf_load = re.match(r"\d+", datas.get("Load", ""))
+        if pdf_load is None or int(pdf_load.group()) != load:
+            problems.append(f"负载 {datas.get('Load')} != {load}%")
+        if datas.get("datas") and line_names.get(datas["datas"][0][9]) != line:
+            problems.append(f"线性 {datas['datas'][0][9]} != {line}")
+        return [f"{source_file}: {p}" for p in problems]
+
+
+def plan_files(source_files):
+    """只扫描文件名，确定单体区块；不符合命名规则的文件记入 warnings，按内容写入"""
+    plan = Plan(source_files)
+    for source_file in source_files:
+        name = split_name(source_file)
+        if name is None:
+            plan.warnings.append(
+                f"{source_file}: 不符合命名规则 序列号-输入电压-负载-线性.pdf，按pdf内容写入"
+            )
+            plan.unplanned.append(source_file)
+            continue
+        plan.names[source_file] = name
+        if name[0] not in plan.serials:
+            plan.serials.append(name[0])
+    return plan
@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+"""
+把pdf解析结果写入excel模板，不依赖Qt
+"""
+import os
+import re
+import zipfile
+import logging
+import threading
+from io import BytesIO
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl.drawing import image
+from openpyxl.styles import Side
+
+from core.fileutil import atomic_path
+from core.manifest import Manifest
+from core.pipeline import parse_dir, InOrder
+from core.archive import zip_folder, DEFLATE_LEVEL
+from core.plan import TemplateLayout, plan_files
+from core.templatecache import load_template, load_variant
+from core.templatemeta import read_template_meta
+from core.imagecache import load_scaled
+from core.oleembed import embed_file
+from core.excelworker import excel_worker
+
+logger = logging.getLogger(__name__)
+
+# 程序自带的模板目录
+template_dir = os.path.join(os.path.dirname(__file__), "..", "..", "template")
+
+line_dict = {"L1": "Line", "N": "Neutral"}
+
+
+class ReportError(Exception):
+    """需要提示给用户的报告生成错误"""
+
+
+class ReportCancelled(ReportError):
+    """用户取消了报告生成"""
+
+
+def uut_name(directory):
+    # 单体型号取目录名的前两段
+    tmpp = os.path.basename(directory).split("-")
+    if len(tmpp) > 1:
+        return tmpp[0] + "-" + tmpp[1]
+    return os.path.basename(directory)
+
+
+def save_name(tmpFile, uutname):
+    return re.sub(r"_\d\.xlsx", f"_{uutname}.xlsx", os.path.basename(tmpFile))
+
+
+def default_template(loadqty):
+    """
+    按负载数量选择默认模板，先找工作目录下的 template/，再找程序自带的模板
+
+    找不到时返回工作目录下的路径
+    """
+    tmpFile = f"2.1 Conducted EMI Measurement_{loadqty}.xlsx"
+    if loadqty not in [3, 4]:
+        logger.warning(f"Unexpected load quantity: {loadqty}, defaulting to 3.")
+        tmpFile = "2.1 Conducted EMI Measurement_3.xlsx"
+    for folder in ("template", template_dir):
+        path = os.path.join(folder, tmpFile)
+        if os.path.exists(path):
+            return path
+    return "template/" + tmpFile
+
+
+def open_template(tmpFile, cache_dir=None, loadqty=None, test_count=None):
+    """
+    返回模板的新副本；同一进程内每个模板只解析一次，cache_dir 为磁盘快照目录
+
+    给出 test_count 时返回只保留 test_count 个单体区块的变体，运行时不必再删行
+    """
+    if test_count is None:
+        return load_template(tmpFile, cache_dir)
+    return load_variant(
+        tmpFile,
+        f"{loadqty}x{test_count}",
+        lambda wb: ReportWriter(wb, loadqty).trim_blocks(test_count),
+        cache_dir,
+    )
+
+
+def build_variants(tmpFile, loadqty, cache_dir=None):
+    """预先生成模板所有单体数量的变体，返回生成的数量"""
+    wb = open_template(tmpFile, cache_dir)
+    blocks = ReportWriter(wb, loadqty).layout().blocks
+    wb.close()
+    for test_count in range(1, blocks + 1):
+        open_template(tmpFile, cache_dir, loadqty, test_count).close()
+    return blocks
+
+
+class ReportWriter:
+    """
+    在已打开的模板工作簿中逐个写入解析结果
+
+    用法: write_header/add_image/trim 准备好模板后，每解析完一个文件调用一次 place，
+    最后 save。
+    """
+
+    def __init__(self, wb, loadqty):
+        self.wb = wb
+        self.loadqty = loadqty
+        self.ws_setup = wb["Setup"]
+        self.ws = wb["Conducted EMI"]
+
+        self.row_sn_ = self.ws_setup.cell(row=1, column=2).value
+        self.col_sn_ = self.ws_setup.cell(row=2, column=2).value
+        self.col_vol_ = self.ws_setup.cell(row=3, column=2).value
+        self.col_line_ = self.ws_setup.cell(row=4, column=2).value
+        self.col_load_ = self.ws_setup.cell(row=5, column=2).value
+        self.row_end_ = self.ws_setup.cell(row=7, column=2).value
+        self.col_end_ = self.ws_setup.cell(row=8, column=2).value
+
+    def write_header(
+        self, uutname, date=None, workerno=None, rev=None, week=None, detail=None
+    ):
+        # 值为None的项保留模板中的内容
+        cells = {
+            "F5": uutname,  # 单体型号
+            "F6": date,  # 测试日期
+            "F44": workerno,  # 工令
+            "H44": rev,  # 版本
+            "I44": week,  # D/C
+            "F8": detail,  # 测试detail
+        }
+        for coord, value in cells.items():
+            if value is not None:
+                self.ws[coord] = value
+
+    def add_image(self, img_path, cache_dir=None):
+        # 放置图片，cache_dir 为缩放结果的缓存目录
+        if not img_path or not os.path.exists(img_path):
+            return
+        img_path = os.path.realpath(img_path)
+        buffer = BytesIO(load_scaled(img_path, cache_dir=cache_dir))
+        img = image.Image(buffer)
+        self.ws.add_image(img, "C27")
+
+    def layout(self):
+        return TemplateLayout.from_sheet(
+            self.ws, self.row_sn_, self.col_vol_, self.col_load_, self.loadqty
+        )
+
+    def trim(self, start, count):
+        """
+        删去 start 开始的 count 行（多余的单体区块）
+
+        openpyxl 的 delete_rows 不移动合并单元格和行高，这里一并处理，
+        并把被删去的最后一行的下边框补到保留的最后一行
+        """
+        ws = self.ws
+        if count > 0:
+            end = start + count - 1
+            for rng in list(ws.merged_cells.ranges):
+                if rng.max_row < start:
+                    continue
+                if rng.min_row > end:
+                    rng.shift(row_shift=-count)
+                else:
+                    ws.unmerge_cells(rng.coord)
+
+            for col in range(1, ws.max_column + 1):
+                bottom = ws.cell(row=end, column=col).border.bottom
+                cell = ws.cell(row=start - 1, column=col)
+                if bottom.style is not None:
+                    cell.border = cell.border.copy(bottom=copy(bottom))
+
+            ws.delete_rows(start, count)
+            for row in sorted(r for r in ws.row_dimensions if r >= start):
+                dim = ws.row_dimensions.pop(row)
+                if row > end:
+                    dim.index = row - count
+                    ws.row_dimensions[row - count] = dim
+            logger.info(f"Max row after deletion: {ws.max_row - 4}")
+        self.row_end_ = ws.max_row - 4
+
+    def trim_blocks(self, test_count):
+        """只保留前 test_count 个单体区块，并把新的结束行写回 Setup"""
+        layout = self.layout()
+        if test_count < layout.blocks:
+            start = self.row_sn_ + self.loadqty * 4 * test_count
+            self.trim(start, self.loadqty * 4 * (layout.blocks - test_count))
+            self.ws_setup.cell(row=7, column=2).value = self.row_end_
+
+    def build_index(self, test_count):
+        """
+        trim 之后扫描一次各单体区块，建立 (区块, 电压, 负载%, 线性) -> 行 的索引
+
+        写入每个结果时只需查表，不再逐行扫描模板
+        """
+        ws = self.ws
+        loadqty = self.loadqty
+        self.test_count = test_count
+        self.slots = {}  # 序列号 -> 区块序号
+        self.index = {}
+        self.voltages = [
+            ws.cell(row=self.row_sn_, column=self.col_vol_).value,
+            ws.cell(row=self.row_sn_ + loadqty * 2, column=self.col_vol_).value,
+        ]
+        for slot in range(test_count):
+            row_block = self.row_sn_ + slot * loadqty * 4
+            for half in range(2):
+                row_vol = row_block + half * loadqty * 2
+                voltage = ws.cell(row=row_vol, column=self.col_vol_).value
+                for i in range(loadqty):
+                    row_load = row_vol + i * 2
+                    load = ws.cell(row=row_load, column=self.col_load_).value
+                    if not isinstance(load, (int, float)):
+                        continue
+                    for row in (row_load, row_load + 1):
+                        line = ws.cell(row=row, column=self.col_line_).value
+                        self.index[(slot, voltage, round(load * 100), line)] = row
+
+    def place(self, datas):
+        """写入一个文件的结果，返回写入的行"""
+        ws = self.ws
+        serial = datas["Serial"]
+        slot = self.slots.get(serial)
+        if slot is None:
+            slot = len(self.slots)
+            if slot >= self.test_count:
+                raise ReportError(f"Number of Load is too many! {slot + 1}")
+            self.slots[serial] = slot
+            row_sn = self.row_sn_ + slot * self.loadqty * 4
+            ws.cell(row=row_sn, column=self.col_sn_).value = serial
+
+        voltage = int(re.match(r"\d+", datas["Power"]).group())
+        if voltage not in self.voltages:
+            # 与上半区块电压不同的都写入下半区块
+            voltage = self.voltages[1]
+        load = int(re.match(r"\d+", datas["Load"]).group())
+        data = datas["datas"][0]
+        # 无法识别的线性写入 Neutral 行
+        line = line_dict.get(data[9], "Neutral")
+        row_line = self.index.get((slot, voltage, load, line))
+        if row_line is None:
+            raise ReportError(
+                f"负载数量与模板不符！{serial} {datas['Power']} {datas['Load']} {line}"
+            )
+
+        # 写入数据
+        ws.cell(row=row_line, column=self.col_load_ + 1).value = data[0]
+        ws.cell(row=row_line, column=self.col_load_ + 2).value = data[1]
+        ws.cell(row=row_line, column=self.col_load_ + 3).value = data[3]
+        ws.cell(row=row_line, column=self.col_load_ + 4).value = data[6]
+        ws.cell(row=row_line, column=self.col_load_ + 5).value = "-"
+        ws.cell(row=row_line, column=self.col_load_ + 6).value = data[2]
+        ws.cell(row=row_line, column=self.col_load_ + 7).value = data[5]
+        return row_line
+
+    def finish(self):
+        """
+        保存前完成所有单元格格式，嵌入压缩包时不再需要在Excel中修改
+
+        最后一行加中等粗细的下边框；取消工作表保护
+        """
+        ws = self.ws
+        for col in range(2, self.col_end_):
+            cell = ws.cell(row=self.row_end_, column=col)
+            cell.border = cell.border.copy(bottom=Side(style="medium"))
+        ws.protection.sheet = False
+
+    def save(self, SaveFile):
+        self.wb.remove(self.ws_setup)
+        self.finish()
+        # 先写临时文件再替换，同时运行的任务不会看到写了一半的报告
+        with atomic_path(SaveFile) as tmp_path:
+            self.wb.save(tmp_path)
+        logger.info("Writted into report.")
+
+
+def prepare_writer(
+    wb, loadqty, plan, uutname, header=None, img_path=None, image_cache=None
+):
+    """
+    按模板布局确定每个文件的目标行，写入表头和图片并删去多余的行
+
+    wb 为 open_template 给出 test_count 时得到的预裁剪变体时不再删行。
+    返回可以逐个写入结果的 ReportWriter；模板放不下时抛出 ReportError
+    """
+    writer = ReportWriter(wb, loadqty)
+    plan.resolve(writer.layout())
+    if plan.conflicts:
+        raise ReportError(conflict_message(plan))
+    for warning in plan.warnings:
+        logger.warning(warning)
+    writer.write_header(uutname, **(header or {}))
+    writer.add_image(img_path, image_cache)
+    writer.trim(plan.delete_start, plan.delete_count)
+    writer.build_index(plan.blocks)
+    return writer
+
+
+def conflict_message(plan):
+    return "文件与模板布局冲突:\n" + "\n".join(plan.conflicts)
+
+
+def place_checked(writer, plan, source_file, datas):
+    """写入结果并与文件名规划比较，返回不一致的项"""
+    row = writer.place(datas)
+    problems = plan.check(source_file, datas)
+    expected = plan.rows.get(source_file)
+    if expected is not None and row != expected:
+        problems.append(f"{source_file}: 写入第{row}行，规划为第{expected}行")
+    for problem in problems:
+        logger.warning(problem)
+    return problems
+
+
+def embed_zip(SaveFile, zippath, row_sn, col_end, engine="openxml"):
+    """
+    把压缩包嵌入已保存的报告（序列号行、倒数第二列），边框等格式已在保存时写好
+
+    engine="openxml" 时直接写入xlsx文件，不需要Excel；
+    engine="excel" 时交给常驻的 Excel 自动化线程，多份报告复用同一个Excel实例
+    """
+    if engine == "excel":
+        excel_worker().call("embed_zip", SaveFile, zippath, row_sn, col_end)
+        return
+    embed_file(SaveFile, zippath, "Conducted EMI", row_sn, col_end - 2)
+
+
+def generate_report(
+    model_dir,
+    template=None,
+    loadqty=3,
+    workers=1,
+    header=None,
+    img_path=None,
+    need_zip=True,
+    cache_path=None,
+    progress=None,
+    pool=None,
+    write_slots=None,
+    template_cache=None,
+    output_dir=None,
+    image_cache=None,
+    compression="lzma",
+    zip_level=DEFLATE_LEVEL,
+    zip_incremental=True,
+    embed=False,
+    embed_engine="openxml",
+    top_k=None,
+):
+    """
+    解析 model_dir 中的pdf并生成excel报告和zip压缩包
+
+    参数见 build_report，压缩包与报告保存在同一目录；
+    compression/zip_level 为压缩方式和 deflate 压缩级别，
+    zip_incremental 为 True 时只重新压缩新增和改动的pdf，见 zip_folder；
+    embed 为 True 时用 embed_engine 把压缩包嵌入报告，见 embed_zip。
+    目录只扫描一次，每个pdf只读取一次：压缩在后台线程中与解析同时进行，
+    两者共用读入内存的内容。报告失败时停止尚未完成的压缩。
+    返回 (报告路径, 压缩包路径或None)
+    """
+    if not os.path.isdir(model_dir):
+        raise ReportError(f"No such directory: {model_dir}")
+    model_dir = os.path.realpath(model_dir)
+    if output_dir is None:
+        zip_dir = os.path.dirname(model_dir)
+    else:
+        zip_dir = os.path.realpath(output_dir)
+    manifest = Manifest(model_dir)
+    stop_zip = threading.Event()
+
+    def zip_progress(done):
+        # 压缩在下一个文件处停止，未完成的临时文件由 zip_folder 删除
+        if stop_zip.is_set():
+            raise ReportCancelled("Zip cancelled.")
+
+    zipper = ThreadPoolExecutor(max_workers=1)
+    zip_future = None
+    try:
+        if need_zip:
+            manifest.prefetch()
+            os.makedirs(zip_dir, exist_ok=True)
+            zip_future = zipper.submit(
+                zip_folder,
+                model_dir,
+                os.path.join(zip_dir, uut_name(model_dir)),
+                zip_progress,
+                workers,
+                pool,
+                compression,
+                zip_level,
+                manifest=manifest,
+                incremental=zip_incremental,
+            )
+        try:
+            SaveFile, writer = build_report(
+                model_dir,
+                template,
+                loadqty,
+                workers,
+                header,
+                img_path,
+                cache_path,
+                progress,
+                pool,
+                write_slots,
+                template_cache,
+                output_dir=output_dir,
+                image_cache=image_cache,
+                manifest=manifest,
+                top_k=top_k,
+            )
+        except BaseException:
+            stop_zip.set()
+            raise
+        zippath = zip_future.result() if zip_future is not None else None
+        if embed and zippath is not None:
+            embed_zip(
+                SaveFile,
+                zippath,
+                writer.row_sn_,
+                writer.col_end_,
+                embed_engine,
+            )
+    finally:
+        zipper.shutdown()
+        manifest.close()
+    return SaveFile, zippath
+
+
+def build_report(
+    model_dir,
+    template=None,
+    loadqty=3,
+    workers=1,
+    header=None,
+    img_path=None,
+    cache_path=None,
+    progress=None,
+    pool=None,
+    write_slots=None,
+    template_cache=None,
+    should_stop=None,
+    problems=None,
+    output_dir=None,
+    image_cache=None,
+    manifest=None,
+    top_k=None,
+    known=None,
+):
+    """
+    解析 model_dir 中的pdf并写入excel报告，保存在 output_dir（默认为 model_dir 的上级目录）
+
+    所有路径都是显式的，不依赖也不改变工作目录，可以在多个线程或进程中同时运行。
+
+    header 为 write_header 的关键字参数（不含 uutname）；
+    template_cache 为模板快照的磁盘缓存目录，None 时只在进程内缓存；
+    image_cache 为测试图片缩放结果的缓存目录；
+    progress(done, total) 在每个文件解析完成后调用；
+    pool 为多个机种共享的解析进程池；
+    write_slots 为限制同时打开的工作簿数量的信号量，从加载模板开始占用到保存结束；
+    should_stop() 返回 True 时在下一个文件处停止并抛出 ReportCancelled；
+    problems 不为 None 时追加pdf内容与文件名规划不一致的项；
+    manifest 为 model_dir 的 Manifest，解析使用其中读入的文件内容，
+    None 时只扫描目录，各文件由解析进程自己读取；
+    top_k 为每个文件保留的结果行数，报告只使用裕量最小的一行，None 时保留整张表；
+    known 为已解析的 {文件名: 结果}，见 DirectoryWatcher.snapshot。
+    返回 (报告路径, 已保存的 ReportWriter)
+    """
+    if not os.path.isdir(model_dir):
+        raise ReportError(f"No such directory: {model_dir}")
+    model_dir = os.path.realpath(model_dir)
+    if output_dir is None:
+        output_dir = os.path.dirname(model_dir)
+    else:
+        output_dir = os.path.realpath(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+    template = template or default_template(loadqty)
+    if not os.path.exists(template):
+        raise ReportError(f"No template file found: {template}")
+    try:
+        # 只读取Setup设置，模板有问题时在解析之前报错
+        _, setup = read_template_meta(template)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise ReportError(f"Invalid template file {template}: {e}")
+    missing = [key for key, value in setup.items() if not isinstance(value, int)]
+    if missing:
+        raise ReportError(f"Invalid Setup values in {template}: {', '.join(missing)}")
+
+    source_files = (manifest or Manifest(model_dir)).pdfs
+    # 解析之前先按文件名规划，命名问题只作为警告
+    plan = plan_files(source_files)
+    uutname = uut_name(model_dir)
+    results = parse_dir(
+        model_dir, source_files, workers, cache_path, pool, manifest, top_k, known
+    )
+    order = InOrder(source_files)
+    ready = []  # 模板准备好之前已按顺序到达的结果
+    found = []
+
+    def prepare():
+        if write_slots is not None:
+            write_slots.acquire()
+        try:
+            return prepare_writer(
+                open_template(
+                    template,
+                    template_cache,
+                    loadqty,
+                    plan.test_count if plan.complete else None,
+                ),
+                loadqty,
+                plan,
+                uutname,
+                header,
+                img_path,
+                image_cache,
+            )
+        except BaseException:
+            if write_slots is not None:
+                write_slots.release()
+            raise
+
+    SaveFile = os.path.join(output_dir, save_name(template, uutname))
+    prep = ThreadPoolExecutor(max_workers=1)
+    future = prep.submit(prepare)
+    try:
+        # 模板加载、图片缩放与解析同时进行
+        with prep:
+            for done, (source_file, data, err) in enumerate(results, 1):
+                if should_stop is not None and should_stop():
+                    raise ReportCancelled("Report cancelled.")
+                if err is not None:
+                    logger.error(f"Error pdf processing {source_file}: {err}")
+                if progress is not None:
+                    progress(done, len(source_files))
+                ready.extend(
+                    (f, d)
+                    for f, d, e in order.push(source_file, data, err)
+                    if e is None
+                )
+                if future.done():
+                    writer = future.result()
+                    for name, datas in ready:
+                        found.extend(place_checked(writer, plan, name, datas))
+                    ready.clear()
+        writer = future.result()
+        for name, datas in ready:
+            found.extend(place_checked(writer, plan, name, datas))
+        if should_stop is not None and should_stop():
+            raise ReportCancelled("Report cancelled.")
+        if 0 < len(writer.slots) < writer.test_count:
+            # 文件名无法规划单体数量时，删去没有写入的区块
+            writer.trim_blocks(len(writer.slots))
+        writer.save(SaveFile)
+    finally:
+        # 提前结束时关闭生成器，取消尚未开始的解析
+        results.close()
+        # prepare 失败时已自行释放
+        if write_slots is not None and future.done() and not future.exception():
+            write_slots.release()
+    if problems is not None:
+        problems.extend(plan.warnings)
+        problems.extend(found)
+    return SaveFile, writer
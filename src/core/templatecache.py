@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+excel模板缓存：每个模板在进程内只用 openpyxl 解析一次，之后从 pickle 快照复制出新的工作簿
+
+磁盘快照保存在当前用户的缓存目录中，并带有用本机密钥计算的 HMAC；
+读入的快照校验不通过时丢弃并从 xlsx 重新生成，不会对别人写入的文件调用 pickle.loads。
+"""
+import os
+import hmac
+import pickle
+import copyreg
+import hashlib
+import logging
+import threading
+
+import openpyxl as xl
+from openpyxl.worksheet.dimensions import DimensionHolder
+
+from core.fileutil import file_hash, atomic_path, user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+templateCacheDir = os.path.join(user_cache_dir(), "templates")
+keyName = "template.key"  # 快照签名密钥，与快照放在同一个用户目录中
+DIGEST_SIZE = hashlib.sha256().digest_size
+# 快照格式版本，与 openpyxl 版本一起决定磁盘快照是否可用
+TEMPLATE_CACHE_VERSION = 1
+
+
+def _restore_dimensions(worksheet, default_factory, items):
+    holder = DimensionHolder(worksheet, default_factory=default_factory)
+    holder.update(items)
+    return holder
+
+
+def _reduce_dimensions(holder):
+    # defaultdict 默认的 pickle 不保存 worksheet 和默认工厂，
+    # 还原后访问不存在的行/列尺寸会 KeyError，副本也无法再次 pickle
+    return _restore_dimensions, (holder.worksheet, holder.default_factory, dict(holder))
+
+
+copyreg.pickle(DimensionHolder, _reduce_dimensions)
+
+
+def snapshot_key(cache_dir):
+    """读取或生成 cache_dir 中的签名密钥（仅当前用户可读），失败时返回 None"""
+    path = os.path.join(cache_dir, keyName)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, "rb") as f:
+                key = f.read()
+        else:
+            key = os.urandom(32)
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+    except OSError as e:
+        logger.warning(f"Template snapshot key unavailable, disk cache disabled: {e}")
+        return None
+    if len(key) != 32:
+        # 另一个进程正在写入密钥，或密钥被改动，这次不使用磁盘快照
+        logger.warning(f"Invalid template snapshot key: {path}")
+        return None
+    return key
+
+
+def sign(key, snapshot):
+    return hmac.new(key, snapshot, hashlib.sha256).digest()
+
+
+class TemplateCache:
+    """
+    以 (路径, 大小, 修改时间) 为键在内存中保存模板工作簿的 pickle 快照
+
+    load() 每次返回一个独立的新工作簿，可以随意修改和保存。
+    load_variant() 返回在模板上预先处理过的变体（例如删去多余区块的模板），
+    每个变体同样只生成一次。
+    cache_dir 不为 None 时快照同时以模板内容哈希为键保存到磁盘，
+    新进程第一次加载时也不必重新解析 xlsx；cache_dir 应是只有当前用户能写入的目录，
+    默认的 templateCacheDir 在用户的本地缓存目录下。
+    每个磁盘快照前写有 HMAC，校验不通过的快照会被重新生成。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._key = None
+        self._snapshots = {}
+        self._lock = threading.RLock()
+
+    def _signing_key(self):
+        if self._key is None:
+            self._key = snapshot_key(self.cache_dir)
+        return self._key
+
+    def _disk_path(self, path, variant):
+        key = f"{file_hash(path)}-{xl.__version__}-{TEMPLATE_CACHE_VERSION}"
+        if variant is not None:
+            key += f"-{variant}"
+        return os.path.join(self.cache_dir, key + ".pickle")
+
+    def _read_disk(self, disk_path, key):
+        """返回校验通过的磁盘快照，不存在或校验不通过时返回 None"""
+        try:
+            with open(disk_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        digest, snapshot = data[:DIGEST_SIZE], data[DIGEST_SIZE:]
+        if not hmac.compare_digest(digest, sign(key, snapshot)):
+            logger.warning(
+                f"Template snapshot failed verification, rebuilding: {disk_path}"
+            )
+            return None
+        logger.debug(f"Template snapshot loaded: {disk_path}")
+        return snapshot
+
+    def _build(self, path, variant, build):
+        disk_path = None
+        key = self._signing_key() if self.cache_dir is not None else None
+        if key is not None:
+            disk_path = self._disk_path(path, variant)
+            snapshot = self._read_disk(disk_path, key)
+            if snapshot is not None:
+                return snapshot
+        if variant is None:
+            wb = xl.load_workbook(path)
+        else:
+            wb = self.load(path)
+            build(wb)
+            logger.info(f"Template variant built: {os.path.basename(path)} {variant}")
+        snapshot = pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL)
+        wb.close()
+        if disk_path is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with atomic_path(disk_path) as tmp_path:
+                    with open(tmp_path, "wb") as f:
+                        f.write(sign(key, snapshot))
+                        f.write(snapshot)
+            except OSError as e:
+                logger.warning(f"Failed to save template snapshot: {e}")
+        return snapshot
+
+    def snapshot(self, path, variant=None, build=None):
+        """返回模板（或其变体）的 pickle 快照，必要时解析模板"""
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        key = (path, st.st_size, st.st_mtime_ns, variant)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                snapshot = self._build(path, variant, build)
+                self._snapshots[key] = snapshot
+        return snapshot
+
+    def load(self, path):
+        """返回模板的一个新副本"""
+        return pickle.loads(self.snapshot(path))
+
+    def load_variant(self, path, variant, build):
+        """
+        返回模板变体的一个新副本
+
+        variant 为变体名称（用于文件名），build(wb) 在模板副本上原地生成该变体
+        """
+        return pickle.loads(self.snapshot(path, variant, build))
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+            if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+                return
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pickle"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+_caches = {}  # cache_dir -> TemplateCache，进程内共享
+
+
+def template_cache(cache_dir=None):
+    cache = _caches.get(cache_dir)
+    if cache is None:
+        cache = _caches.setdefault(cache_dir, TemplateCache(cache_dir))
+    return cache
+
+
+def load_template(path, cache_dir=None):
+    return template_cache(cache_dir).load(path)
+
+
+def load_variant(path, variant, build, cache_dir=None):
+    return template_cache(cache_dir).load_variant(path, variant, build)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+不加载整个工作簿，直接从 xlsx 的 XML 中读取模板的测试说明和 Setup 设置
+"""
+import posixpath
+import zipfile
+import logging
+from xml.etree import ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Setup 表B列各行的含义，与 ReportWriter 的属性同名
+setup_rows = {
+    1: "row_sn_",
+    2: "col_sn_",
+    3: "col_vol_",
+    4: "col_line_",
+    5: "col_load_",
+    7: "row_end_",
+    8: "col_end_",
+}
+
+
+def split_ref(ref):
+    """'F8' -> (8, 6)"""
+    letters = ref.rstrip("0123456789")
+    col = 0
+    for ch in letters:
+        col = col * 26 + ord(ch) - 64
+    return int(ref[len(letters) :]), col
+
+
+def sheet_paths(zf):
+    """工作表名称 -> 压缩包内的 XML 路径"""
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {
+        rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{NS_PKG}Relationship")
+    }
+    workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+    paths = {}
+    for sheet in workbook.iter(f"{NS}sheet"):
+        target = targets[sheet.get(f"{NS_REL}id")]
+        if target.startswith("/"):
+            paths[sheet.get("name")] = target[1:]
+        else:
+            paths[sheet.get("name")] = posixpath.normpath(posixpath.join("xl", target))
+    return paths
+
+
+def shared_strings(zf):
+    if "xl/sharedStrings.xml" not in zf.namelist():
+        return []
+    strings = []
+    for _, elem in ET.iterparse(zf.open("xl/sharedStrings.xml")):
+        if elem.tag == f"{NS}si":
+            # 富文本由多个 <r><t> 组成，注音 <rPh> 不计入
+            strings.append(
+                "".join(
+                    t.text or ""
+                    for t in elem.iter(f"{NS}t")
+                    if t not in elem.findall(f"{NS}rPh/{NS}t")
+                )
+            )
+            elem.clear()
+    return strings
+
+
+def cell_value(c, strings):
+    t = c.get("t")
+    if t == "inlineStr":
+        return "".join(x.text or "" for x in c.iter(f"{NS}t"))
+    v = c.find(f"{NS}v")
+    if v is None or v.text is None:
+        return None
+    if t == "s":
+        return strings[int(v.text)]
+    if t in ("str", "e"):
+        return v.text
+    if t == "b":
+        return v.text == "1"
+    number = float(v.text)
+    return int(number) if number.is_integer() else number
+
+
+def read_cells(zf, path, cells, strings):
+    """读取一个工作表中的指定单元格 {(行, 列), ...}，读到最后一行即停止"""
+    last_row = max(row for row, _ in cells)
+    values = dict.fromkeys(cells)
+    for _, elem in ET.iterparse(zf.open(path)):
+        if elem.tag == f"{NS}c":
+            ref = split_ref(elem.get("r"))
+            if ref in values:
+                values[ref] = cell_value(elem, strings)
+        elif elem.tag == f"{NS}row":
+            if int(elem.get("r")) >= last_row:
+                break
+            elem.clear()
+    return values
+
+
+def read_template_meta(tmpFile):
+    """
+    返回 (测试说明 Conducted EMI!F8, Setup设置字典)
+
+    缺少工作表时抛出 KeyError
+    """
+    with zipfile.ZipFile(tmpFile) as zf:
+        paths = sheet_paths(zf)
+        for name in ("Conducted EMI", "Setup"):
+            if name not in paths:
+                raise KeyError(f"Sheet '{name}' not found in {tmpFile}")
+        strings = shared_strings(zf)
+        detail = read_cells(zf, paths["Conducted EMI"], {(8, 6)}, strings)[(8, 6)]
+        values = read_cells(
+            zf, paths["Setup"], {(row, 2) for row in setup_rows}, strings
+        )
+    setup = {key: values[(row, 2)] for row, key in setup_rows.items()}
+    return detail, setup
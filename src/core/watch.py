@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+监视机种目录，ELEKTRA导出的pdf写入完成后立即解析，不依赖Qt
+"""
+import os
+import time
+import logging
+import threading
+
+from core.pdfparse import list_pdfs
+from core.pipeline import parse_dir
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryWatcher:
+    """
+    轮询方式监视目录（网络共享目录上也可用）
+
+    文件的大小和修改时间连续 settle 次轮询不变且可以打开时，认为写入已完成并解析；
+    结果保存在 results 中（cache_path 不为 None 时同时写入解析缓存），
+    生成报告时把 snapshot() 交给 parse_dir，这些文件不再查缓存和解析。
+    """
+
+    def __init__(self, directory, cache_path=None, workers=1, settle=2):
+        self.directory = directory
+        self.cache_path = cache_path
+        self.workers = workers
+        self.settle = settle
+        self.results = {}  # 文件名 -> 解析结果
+        self._seen = {}  # 文件名 -> ((大小, 修改时间), 连续不变的次数)
+        self._parsed = {}  # 文件名 -> 解析时的 (大小, 修改时间)
+        self._lock = threading.Lock()  # snapshot() 在其他线程中调用
+
+    def poll(self):
+        """检查一次目录，解析写入完成的新文件或已改动的文件，返回 [(文件名, 结果, 异常)]"""
+        ready = []
+        names = list_pdfs(self.directory)
+        for name in names:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            last_key, stable = self._seen.get(name, (None, 0))
+            stable = stable + 1 if key == last_key else 0
+            self._seen[name] = (key, stable)
+            if (
+                stable >= self.settle
+                and st.st_size > 0
+                and self._parsed.get(name) != key
+                and self._readable(name)
+            ):
+                ready.append(name)
+        for name in set(self._seen) - set(names):
+            # 文件被删除或改名
+            del self._seen[name]
+            with self._lock:
+                self._parsed.pop(name, None)
+                self.results.pop(name, None)
+        if not ready:
+            return []
+
+        parsed = []
+        for name, data, err in parse_dir(
+            self.directory, ready, self.workers, self.cache_path
+        ):
+            with self._lock:
+                self._parsed[name] = self._seen[name][0]
+                if err is None:
+                    self.results[name] = data
+            if err is not None:
+                logger.error(f"Watch: error pdf processing {name}: {err}")
+            else:
+                logger.info(f"Watch: parsed {name}")
+            parsed.append((name, data, err))
+        return parsed
+
+    def snapshot(self):
+        """返回 {文件名: 结果}，只包含解析之后没有再改动的文件"""
+        with self._lock:
+            items = [(n, d, self._parsed[n]) for n, d in self.results.items()]
+        known = {}
+        for name, data, key in items:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            if (st.st_size, st.st_mtime_ns) == key:
+                known[name] = data
+        return known
+
+    def _readable(self, name):
+        # Windows下正在写入的文件无法打开
+        try:
+            with open(os.path.join(self.directory, name), "rb"):
+                return True
+        except OSError:
+            return False
+
+    def run(self, interval=2.0, should_stop=None, callback=None):
+        """循环轮询直到 should_stop() 为真；callback(文件名, 结果, 异常) 在每个文件解析后调用"""
+        logger.info(f"Watching {self.directory} every {interval}s")
+        while should_stop is None or not should_stop():
+            for item in self.poll():
+                if callback is not None:
+                    callback(*item)
+            time.sleep(interval)
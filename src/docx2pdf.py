@@ -1,30 +1,44 @@
 import os
 import sys
-import win32com.client as win32
+import argparse
+import multiprocessing
+
+from core.docxconvert import ConverterPool, ConvertPlan
+from core.fileutil import default_workers
+
+
+def convert_docx2pdf(docx_dir, workers=None, incremental=True):
+    """转换 docx_dir 中新增或修改过的docx，返回失败的文件数"""
+    plan = ConvertPlan(docx_dir, incremental)
+    errors = 0
+    with ConverterPool(workers=workers) as pool:
+        for docx_file, _, err in plan.run(pool):
+            if err is not None:
+                print(f"Error converting {docx_file}: {err}")
+                errors += 1
+    print(f"{errors} Fail / {len(plan.todo)} Total files convert.")
+    if plan.skipped:
+        print(
+            f"{len(plan.skipped)} unchanged files skipped, "
+            f"about {plan.saved:.1f}s saved."
+        )
+    return errors
 
-def convert_docx2pdf(docx_dir):
-    try:
-        word = win32.Dispatch('Word.Application')
-        word.Visible = False
-    except:
-        print("Please install Microsoft Word 2010 or later.")
-        return
-    for file in os.listdir(docx_dir):
-        if file.endswith(".docx"):
-            docx_file = os.path.join(docx_dir, file)
-            pdf_file = os.path.join(docx_dir, file.replace(".docx", ".pdf"))
-            doc = word.Documents.Open(os.path.abspath(docx_file))
-            doc.SaveAs(os.path.abspath(pdf_file), FileFormat=17)
-            # 不保存退出
-            doc.Close(SaveChanges=0)
-    word.Quit()
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python docx2pdf.py <docx_dir>")
-        sys.exit(1)
-    docx_dir = sys.argv[1]
-    if not os.path.exists(docx_dir):
+    # 打包后的程序启动Word工作进程时需要，否则每个工作进程都会重新运行命令行
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Convert docx files to pdf with Word")
+    parser.add_argument("docx_dir")
+    parser.add_argument(
+        "--workers", type=int, default=default_workers(), help="Word进程数"
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="忽略转换清单，重新转换所有文件"
+    )
+    args = parser.parse_args()
+    if not os.path.exists(args.docx_dir):
         print("Error: docx_dir not exists.")
         sys.exit(1)
-    convert_docx2pdf(docx_dir)
\ No newline at end of file
+    errors = convert_docx2pdf(args.docx_dir, args.workers, not args.full)
+    sys.exit(1 if errors else 0)
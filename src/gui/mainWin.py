@@ -270,8 +270,14 @@ class MainWindow(QMainWindow):
         self.action_topdf.setShortcut("Ctrl+T")
         self.action_wordreplace = QAction(self.tr("word替换"), self)
         self.action_wordreplace.setShortcut("Ctrl+G")
+        self.action_watch = QAction(self.tr("监视数据目录"), self.menuTool)
+        self.action_watch.setCheckable(True)
+        self.action_watch.setStatusTip(
+            self.tr("边导出边解析，结果保存在内存中，开始生成报告时直接使用")
+        )
         self.menuTool.addAction(self.action_log)
         self.menuTool.addAction(self.action_topdf)
+        self.menuTool.addAction(self.action_watch)
         self.addAction(self.action_wordreplace)
         self.mainMenuBar.addMenu(self.menuTool)
 
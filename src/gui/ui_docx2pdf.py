@@ -5,6 +5,7 @@ from PySide6.QtGui import (
     QIcon,
 )
 from PySide6.QtWidgets import (
+    QCheckBox,
     QGridLayout,
     QHBoxLayout,
     QLabel,
@@ -21,9 +22,10 @@ from PySide6.QtWidgets import (
 )
 
 import os
-import win32com.client as win32
 import logging
-import win32com.client as win32
+
+from core.docxconvert import ConverterPool, ConvertPlan
+from core.fileutil import default_workers
 
 logger = logging.getLogger(__name__)
 
@@ -31,65 +33,49 @@ logger = logging.getLogger(__name__)
 class ConvertThread(QThread):
     docx_count = Signal(int)
     docx_curr = Signal(int)
-    docx_end = Signal()
+    docx_end = Signal(int)  # 发送失败的文件数
     docx_error = Signal(str)
+    docx_skipped = Signal(int, float)  # 发送跳过的文件数和节省的时间
 
-    def __init__(self, docx_path=None):
+    def __init__(self, docx_path=None, workers=None, incremental=True):
         super().__init__()
         self.docx_path = docx_path
+        self.workers = workers or default_workers()  # Word进程数
+        self.incremental = incremental  # 只转换新增或修改过的文件
         self.stop = False
 
     def run(self):
-        if self.docx_path is None:
-            return
-        else:
-            docx_path = self.docx_path
-        try:
-            word = win32.Dispatch("Word.Application")
-            word.Visible = False
-        except:
-            print("Please install Microsoft Word 2010 or later.")
-            logger.error("Please install Microsoft Word 2010 or later.")
-            QMessageBox.warning(
-                self, "Error", "Please install Microsoft Word 2010 or later."
-            )
-            return
-        docx_path = os.path.abspath(docx_path)
-        if os.path.isdir(docx_path):
-            source_files = [f for f in os.listdir(docx_path) if f.endswith(".docx")]
-        else:
-            source_files = [docx_path]
-        file_count = len(source_files)
-        self.docx_count.emit(file_count)
-        curr = 0
         error_counts = 0
-        self.docx_curr.emit(curr)
-        for file_ in source_files:
-            if self.stop:
-                break
-            docx_file = os.path.join(docx_path, file_)
-            pdf_file = os.path.join(docx_path, file_.replace(".docx", ".pdf"))
-            try:
-                doc = word.Documents.Open(os.path.abspath(docx_file))
-                doc.SaveAs(os.path.abspath(pdf_file), FileFormat=17)
-                doc.Close(SaveChanges=False)
-                logger.info(f"Converted {docx_file} to PDF.")
-            except Exception as e:
-                logger.error(f"Error converting {docx_file} to PDF: {e}")
-                error_counts += 1
-            curr = curr + 1
+        try:
+            if self.docx_path is None:
+                return
+            plan = ConvertPlan(self.docx_path, self.incremental)
+            self.docx_skipped.emit(len(plan.skipped), plan.saved)
+            file_count = len(plan.todo)
+            self.docx_count.emit(file_count)
+            curr = 0
             self.docx_curr.emit(curr)
-        if error_counts > 0:
-            QMessageBox.warning(
-                self, "Warning", f"{error_counts} files failed to convert."
-            )
-        logger.info(f"{error_counts} Fail / {file_count} Total files convert.")
-        word.Quit()
-        self.docx_end.emit()
-
-    def terminate(self):
+            # 多个Word进程从同一个队列中领取文件，按完成顺序更新进度
+            workers = min(self.workers, max(file_count, 1))
+            with ConverterPool(workers=workers) as pool:
+                for _, _, err in plan.run(pool, lambda: self.stop):
+                    if err is not None:
+                        error_counts += 1
+                    curr = curr + 1
+                    self.docx_curr.emit(curr)
+            if error_counts > 0:
+                self.docx_error.emit(f"{error_counts} files failed to convert.")
+            logger.info(f"{error_counts} Fail / {file_count} Total files convert.")
+        except Exception as e:
+            logger.error(f"Error converting docx: {e}")
+            self.docx_error.emit(f"Error converting docx: {e}")
+        finally:
+            # 无论成功与否都通知界面结束，否则之后的转换都会被拒绝
+            self.docx_end.emit(error_counts)
+
+    def cancel(self):
+        # 正在转换的文件完成后结束，并关闭所有Word进程
         self.stop = True
-        return super().terminate()
 
 
 class Ui_Docx2PdfWin(QMainWindow):
@@ -147,6 +133,12 @@ class Ui_Docx2PdfWin(QMainWindow):
 
         self.horizontalLayout.addItem(self.horizontalSpacer)
 
+        self.check_incremental = QCheckBox(self.centralwidget)
+        self.check_incremental.setObjectName("check_incremental")
+        self.check_incremental.setChecked(True)
+
+        self.horizontalLayout.addWidget(self.check_incremental)
+
         self.btn_docx2pdf = QPushButton(self.centralwidget)
         self.btn_docx2pdf.setObjectName("btn_docx2pdf")
         sizePolicy.setHeightForWidth(self.btn_docx2pdf.sizePolicy().hasHeightForWidth())
@@ -211,6 +203,20 @@ class Ui_Docx2PdfWin(QMainWindow):
         self.btn_docxcancel.setText(
             QCoreApplication.translate("Docx2PdfWin", "\u8fd4 \u56de", None)
         )
+        self.check_incremental.setText(
+            QCoreApplication.translate(
+                "Docx2PdfWin",
+                "\u4ec5\u8f6c\u6362\u4fee\u6539\u8fc7\u7684\u6587\u4ef6",
+                None,
+            )
+        )
+        self.check_incremental.setToolTip(
+            QCoreApplication.translate(
+                "Docx2PdfWin",
+                "\u6309\u76ee\u5f55\u4e2d\u7684 docx2pdf.manifest.json \u8df3\u8fc7\u4e0a\u6b21\u8f6c\u6362\u540e\u672a\u4fee\u6539\u7684\u6587\u4ef6",
+                None,
+            )
+        )
 
     # retranslateUi
 
@@ -219,6 +225,8 @@ class Docx2PdfWindow(Ui_Docx2PdfWin):
     def __init__(self, parent=None, rootpath=None):
         super().__init__(parent)
         self.running = False
+        self.pgBar = None
+        self.curr = 0
 
         self.setupUi(self)
         self.rootpath = (
@@ -228,6 +236,8 @@ class Docx2PdfWindow(Ui_Docx2PdfWin):
         )
         self.docx2pdf_thread = None
         self.path = ""
+        self.skipped = 0
+        self.saved = 0.0
 
         self.btn_docxdir.clicked.connect(lambda: self.select_docx_path(is_dir=True))
         self.button_docxfile.clicked.connect(
@@ -265,14 +275,27 @@ class Docx2PdfWindow(Ui_Docx2PdfWin):
             logger.warning("docx2pdfThread is running, do not start again")
             return
         self.running = True
+        self.curr = 0
+        self.skipped = 0
         logger.info("docx2pdfThread start")
         self.path = self.textEdit_docx.text()
-        self.docx2pdf_thread = ConvertThread(self.path)
+        self.docx2pdf_thread = ConvertThread(
+            self.path, incremental=self.check_incremental.isChecked()
+        )
+        self.docx2pdf_thread.docx_skipped.connect(self.setSkipped)
         self.docx2pdf_thread.docx_count.connect(self.createStatusBar)
         self.docx2pdf_thread.docx_curr.connect(self.updateStatusBar)
         self.docx2pdf_thread.docx_end.connect(self.endStatus)
+        self.docx2pdf_thread.docx_error.connect(
+            lambda msg: QMessageBox.warning(self, "Warning", msg)
+        )
         self.docx2pdf_thread.start()
 
+    @Slot(int, float)
+    def setSkipped(self, skipped, saved):
+        self.skipped = skipped
+        self.saved = saved
+
     @Slot(int)
     def createStatusBar(self, file_count):
         self.file_count = file_count
@@ -291,15 +314,18 @@ class Docx2PdfWindow(Ui_Docx2PdfWin):
         self.pgBar.setValue(value)
         self.statusBar_docx.showMessage(f"正在转换DOCX文件...{value}/{self.file_count}")
 
-    @Slot()
-    def endStatus(self):
-        self.statusBar_docx.removeWidget(self.pgBar)
-        self.statusBar_docx.showMessage(
-            f"转换DOCX文件:{self.curr}成功/{self.file_count-self.curr}失败"
-        )
+    @Slot(int)
+    def endStatus(self, error_counts):
+        if self.pgBar is not None:
+            self.statusBar_docx.removeWidget(self.pgBar)
+            self.pgBar = None
+        message = f"转换DOCX文件:{self.curr - error_counts}成功/{error_counts}失败"
+        if self.skipped:
+            message += f"，跳过{self.skipped}个未修改的文件，节省约{self.saved:.0f}秒"
+        self.statusBar_docx.showMessage(message)
         self.running = False
 
     def closeEvent(self, event):
         if hasattr(self, "docx2pdf_thread") and self.docx2pdf_thread is not None:
-            self.docx2pdf_thread.terminate()
+            self.docx2pdf_thread.cancel()
         return super().closeEvent(event)
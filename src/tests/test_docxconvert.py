@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+ConverterPool 的调度测试：用 FakeConverter 模拟成功、出错、换进程重试和卡死
+
+在 src 目录下运行: python -m unittest discover -s tests
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from core.docxconvert import ConverterPool, FakeConverter, convert_jobs
+
+
+class AppConverter(FakeConverter):
+    """像Word一样另外启动一个外部进程的假转换器，进程号写入 APP_PID_LOG"""
+
+    def start(self):
+        self.app = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            start_new_session=True,
+        )
+        self.pid = self.app.pid
+        with open(os.environ["APP_PID_LOG"], "a") as f:
+            f.write(f"{self.pid}\n")
+
+    def quit(self):
+        self.app.terminate()
+        self.app.wait()
+        self.pid = None
+
+
+def alive(pid):
+    """进程仍在运行时返回 True（已退出但未回收的僵尸进程视为已结束）"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+class ConverterPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_docs(self, **actions):
+        """actions 为 {文件名: FakeConverter 的动作}，返回按文件名排序的任务"""
+        for name, action in actions.items():
+            with open(os.path.join(self.dir, name + ".docx"), "w") as f:
+                f.write(action)
+        return sorted(convert_jobs(self.dir))
+
+    def convert(self, jobs, factory=FakeConverter, workers=2, timeout=30):
+        with ConverterPool(factory, workers=workers, timeout=timeout) as pool:
+            results = {
+                os.path.basename(src): error
+                for src, dst, error in pool.iter_convert(jobs)
+            }
+        return results, pool
+
+    def test_success(self):
+        jobs = self.make_docs(a="", b="", c="", d="")
+        results, pool = self.convert(jobs)
+        self.assertEqual(
+            results, dict.fromkeys(["a.docx", "b.docx", "c.docx", "d.docx"])
+        )
+        self.assertEqual(pool.restarts, 0)
+        for src, dst in jobs:
+            with open(dst, encoding="utf-8") as f:
+                self.assertTrue(f.read().startswith(os.path.basename(src)))
+
+    def test_error_is_reported_after_every_worker_failed(self):
+        jobs = self.make_docs(a="", bad="error")
+        results, _ = self.convert(jobs)
+        self.assertIsNone(results["a.docx"])
+        self.assertIn("RuntimeError: cannot convert bad.docx", results["bad.docx"])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "bad.pdf")))
+
+    def test_retry_on_another_worker(self):
+        jobs = self.make_docs(flaky="error once")
+        results, _ = self.convert(jobs)
+        self.assertEqual(results, {"flaky.docx": None})
+
+    def test_no_retry_on_the_same_worker(self):
+        # 每个文件在每个进程中只尝试一次，只有一个进程时失败即为最终结果
+        jobs = self.make_docs(flaky="error once")
+        results, _ = self.convert(jobs, workers=1)
+        self.assertIn("RuntimeError", results["flaky.docx"])
+
+    def test_timeout_restarts_worker(self):
+        jobs = self.make_docs(a="", b="", stuck="hang once")
+        start = time.monotonic()
+        results, pool = self.convert(jobs, timeout=2)
+        self.assertEqual(results, dict.fromkeys(["a.docx", "b.docx", "stuck.docx"]))
+        self.assertEqual(pool.restarts, 1)
+        self.assertLess(time.monotonic() - start, FakeConverter.HANG_SECONDS)
+
+    @unittest.skipUnless(os.path.isdir("/proc"), "needs /proc to inspect processes")
+    def test_timeout_kills_external_process(self):
+        log = os.path.join(self.dir, "pids.log")
+        os.environ["APP_PID_LOG"] = log
+        self.addCleanup(os.environ.pop, "APP_PID_LOG")
+        jobs = self.make_docs(stuck="hang once")
+        results, pool = self.convert(jobs, AppConverter, timeout=2)
+        self.assertEqual(results, {"stuck.docx": None})
+        self.assertEqual(pool.restarts, 1)
+        with open(log) as f:
+            pids = [int(pid) for pid in f.read().split()]
+        # 卡住的进程的外部进程被 kill_app 结束，重试的进程退出时正常关闭
+        self.assertEqual(len(pids), 2)
+        time.sleep(0.5)
+        self.assertFalse(any(alive(pid) for pid in pids))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+ExcelWorker 的测试：用 FakeExcelBackend 代替Excel，检查实例的复用、重启和关闭
+
+在 src 目录下运行: python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from core.excelworker import ExcelWorker, FakeExcelBackend
+
+
+class Recorder:
+    """记录创建的每个后端，可以让后端在 embed_zip 中等待或失败"""
+
+    def __init__(self):
+        self.backends = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self):
+        backend = FakeExcelBackend()
+        original = backend.embed_zip
+
+        def embed_zip(SaveFile, zippath, row_sn, col_end):
+            self.gate.wait()
+            return original(SaveFile, zippath, row_sn, col_end)
+
+        backend.embed_zip = embed_zip
+        self.backends.append(backend)
+        return backend
+
+
+class ExcelWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.report = os.path.join(self.dir, "report.xlsx")
+        self.zip = os.path.join(self.dir, "model.zip")
+        for path in (self.report, self.zip):
+            open(path, "w").close()
+        self.recorder = Recorder()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def embed(self, worker, zippath=None, recycle=False):
+        return worker.submit(
+            "embed_zip", self.report, zippath or self.zip, 44, 27, recycle=recycle
+        )
+
+    def test_recycle_after_max_jobs(self):
+        worker = ExcelWorker(self.recorder, max_jobs=2)
+        for _ in range(5):
+            self.embed(worker).result()
+        worker.shutdown()
+        self.assertEqual(worker.instances, 3)
+        self.assertEqual([len(b.embedded) for b in self.recorder.backends], [2, 2, 1])
+        # 每个实例都已退出
+        self.assertFalse(any(b.running for b in self.recorder.backends))
+
+    def test_recycle_on_request(self):
+        worker = ExcelWorker(self.recorder)
+        self.embed(worker, recycle=True).result()
+        self.embed(worker).result()
+        worker.shutdown()
+        self.assertEqual(worker.instances, 2)
+
+    def test_restart_after_failed_job(self):
+        worker = ExcelWorker(self.recorder)
+        self.embed(worker).result()
+        missing = os.path.join(self.dir, "missing.zip")
+        with self.assertRaises(FileNotFoundError):
+            self.embed(worker, zippath=missing).result()
+        self.embed(worker).result()
+        worker.shutdown()
+        first, second = self.recorder.backends
+        self.assertEqual(len(first.embedded), 1)
+        self.assertFalse(first.running)
+        self.assertEqual(len(second.embedded), 1)
+        self.assertEqual(worker.instances, 2)
+
+    def test_shutdown_drains_queue(self):
+        worker = ExcelWorker(self.recorder)
+        # 第一个任务阻塞时提交其余任务，shutdown 应等它们全部完成
+        self.recorder.gate.clear()
+        futures = [self.embed(worker) for _ in range(4)]
+        threading.Timer(0.2, self.recorder.gate.set).start()
+        worker.shutdown()
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual([f.exception() for f in futures], [None] * 4)
+        (backend,) = self.recorder.backends
+        self.assertEqual(len(backend.embedded), 4)
+        self.assertFalse(backend.running)
+
+    def test_submit_after_shutdown_starts_again(self):
+        worker = ExcelWorker(self.recorder)
+        self.embed(worker).result()
+        worker.shutdown()
+        self.embed(worker).result()
+        worker.shutdown()
+        self.assertEqual(worker.instances, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
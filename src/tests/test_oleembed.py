@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+embed_file 的往返测试：嵌入压缩包后重新打开报告，从复合文档中取回原来的字节
+
+在 src 目录下运行: python -m unittest discover -s tests
+"""
+import os
+import shutil
+import struct
+import zipfile
+import tempfile
+import unittest
+from io import BytesIO
+
+import openpyxl as xl
+
+from core.oleembed import embed_file
+
+try:
+    import olefile
+except ImportError:
+    olefile = None
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "template",
+    "2.1 Conducted EMI Measurement_3.xlsx",
+)
+
+
+def read_ole10native(stream):
+    """解析 Ole10Native 流，返回 (标签, 文件内容, Unicode 文件名)"""
+
+    def cstr(pos):
+        end = stream.index(b"\x00", pos)
+        return stream[pos:end], end + 1
+
+    (size,) = struct.unpack_from("<I", stream, 0)
+    assert size == len(stream) - 4
+    pos = 6  # 长度和类型
+    label, pos = cstr(pos)
+    _, pos = cstr(pos)  # 原路径
+    pos += 4
+    (tmp_len,) = struct.unpack_from("<I", stream, pos)
+    pos += 4 + tmp_len  # 临时路径
+    (data_len,) = struct.unpack_from("<I", stream, pos)
+    pos += 4
+    data = stream[pos : pos + data_len]
+    pos += data_len
+    (wide_len,) = struct.unpack_from("<I", stream, pos)
+    wide = stream[pos + 4 : pos + 4 + wide_len * 2].decode("utf-16-le")
+    return label, data, wide
+
+
+@unittest.skipIf(olefile is None, "olefile is not installed")
+class EmbedRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # 与生成报告相同，由 openpyxl 保存的工作簿
+        wb = xl.load_workbook(TEMPLATE)
+        self.report = os.path.join(self.dir, "report.xlsx")
+        wb.save(self.report)
+        wb.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_zip(self, name):
+        buf = BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_LZMA) as zf:
+            zf.writestr("FSC048-4C0G/QP_L1.pdf", b"%PDF-1.4 " + os.urandom(5000))
+            zf.writestr("FSC048-4C0G/AV_N.pdf", b"%PDF-1.4 " + bytes(20000))
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(buf.getvalue())
+        return path, buf.getvalue()
+
+    def embedded(self, name):
+        zippath, payload = self.make_zip(name)
+        embed_file(self.report, zippath, "Conducted EMI", 44, 25)
+
+        # 嵌入后openpyxl仍能打开报告
+        xl.load_workbook(self.report).close()
+        with zipfile.ZipFile(self.report) as zf:
+            self.assertIsNone(zf.testzip())
+            ole = olefile.OleFileIO(zf.read("xl/embeddings/oleObject1.bin"))
+        try:
+            self.assertTrue(ole.exists("\x01CompObj"))
+            stream = ole.openstream("\x01Ole10Native").read()
+        finally:
+            ole.close()
+        return payload, read_ole10native(stream)
+
+    def test_zip_round_trip(self):
+        payload, (label, data, wide) = self.embedded("FSC048-4C0G.zip")
+        self.assertEqual(label, b"FSC048-4C0G.zip")
+        self.assertEqual(wide, "FSC048-4C0G.zip")
+        self.assertEqual(data, payload)
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(len(zf.namelist()), 2)
+
+    def test_unicode_name(self):
+        payload, (_, data, wide) = self.embedded("测试-4C0G.zip")
+        self.assertEqual(wide, "测试-4C0G.zip")
+        self.assertEqual(data, payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+PdfCache 的测试：命中、内容哈希命中，以及未命中时记下的键不会一直留在内存中
+
+在 src 目录下运行: python -m unittest discover -s tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.pdfcache import PdfCache
+
+
+class PdfCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = PdfCache(os.path.join(self.dir, "cache.db"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_put_then_get(self):
+        path = self.write("a.pdf", b"report a")
+        self.assertIsNone(self.cache.get(path))
+        self.cache.put(path, {"Serial": "SN001"})
+        self.assertEqual(self.cache.get(path), {"Serial": "SN001"})
+        # 内容相同的副本按哈希命中
+        copy = self.write("copy.pdf", b"report a")
+        self.assertEqual(self.cache.get(copy), {"Serial": "SN001"})
+        self.assertEqual(self.cache._keys, {})
+
+    def test_failed_parse_does_not_keep_key(self):
+        paths = [self.write(f"{i}.pdf", b"bad %d" % i) for i in range(10)]
+        for path in paths:
+            self.assertIsNone(self.cache.get(path))
+            self.cache.discard(path)
+        self.assertEqual(self.cache._keys, {})
+
+    def test_put_rehashes_file_changed_after_get(self):
+        path = self.write("a.pdf", b"old")
+        self.assertIsNone(self.cache.get(path))
+        self.write("a.pdf", b"new content")
+        self.cache.put(path, {"Serial": "SN002"})
+        copy = self.write("copy.pdf", b"new content")
+        self.assertEqual(self.cache.get(copy), {"Serial": "SN002"})
+
+
+if __name__ == "__main__":
+    unittest.main()